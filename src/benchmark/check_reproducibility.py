@@ -0,0 +1,91 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import argparse
+import sys
+
+import numpy as np
+
+from src.data import derive_seeds, load_data, load_params
+from src.data.split_train_dev import create_split_df, get_splits
+from src.models.estimators import categorical_mask, get_estimator, seed_estimators
+from src.models.metrics import cross_validate_binary
+
+
+def cross_validate(x, y, cv_splits, model, random_seed, n_jobs):
+    """Cross validate fold estimators seeded with derive_seeds"""
+    return cross_validate_binary(model, x, y, cv=cv_splits,
+                                 return_oof=True,
+                                 init_estimators=seed_estimators(
+                                     model, derive_seeds(random_seed, "fold", len(cv_splits))),
+                                 n_jobs=n_jobs)
+
+
+def main(train_path, cv_idx_path, n_jobs=-1):
+    """Check that serial and parallel runs of split_train_dev and train_model
+    produce bit-identical splits, out-of-fold predictions and metrics.
+    Returns the names of the outputs that differ"""
+    train_df, cv_idx = load_data([train_path, cv_idx_path],
+                                 sep=",", header=0,
+                                 index_col="PassengerId")
+
+    # load params
+    params = load_params()
+    params_split = params["train_test_split"]
+    classifier = params["classifier"]
+    target_class = params_split["target_class"]
+
+    x_train = train_df.drop(columns=target_class).to_numpy()
+    y_train = train_df[target_class].to_numpy()
+    model = get_estimator(classifier, params["model_params"][classifier],
+                          random_state=params["random_seed"],
+                          categorical_features=categorical_mask(
+                              train_df.columns.drop(target_class), params["dtypes"],
+                              target_class=target_class))
+
+    mismatch = []
+
+    # splits are a pure function of the labels and random_seed
+    split_df = create_split_df(y_train, n_split=params_split["n_split"],
+                               n_repeats=params_split["n_repeats"],
+                               n_inner_split=params_split["n_inner_split"],
+                               shuffle=params_split["shuffle"],
+                               random_seed=params["random_seed"])
+    if not split_df.astype(str).equals(cv_idx.fillna("").astype(str)):
+        mismatch.append("split_train_dev")
+    print(f"split_train_dev: {'MISMATCH' if mismatch else 'ok'}")
+
+    # serial and parallel cross validation
+    cv_splits = list(get_splits(cv_idx).values())
+    serial = cross_validate(x_train, y_train, cv_splits, model,
+                            params["random_seed"], n_jobs=1)
+    parallel = cross_validate(x_train, y_train, cv_splits, model,
+                              params["random_seed"], n_jobs=n_jobs)
+
+    for key in [elem for elem in serial if elem.startswith("test_") or elem == "oof_proba"]:
+        if not np.array_equal(serial[key], parallel[key], equal_nan=True):
+            mismatch.append(key)
+        print(f"{key}: {'MISMATCH' if key in mismatch else 'ok'}")
+
+    return mismatch
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-tr", "--train", dest="train_path",
+                        required=True, help="Train CSV file")
+    parser.add_argument("-cv", "--cvindex", dest="cv_index",
+                        required=True, help="CSV file with train/dev split")
+    parser.add_argument("-j", "--jobs", dest="n_jobs", type=int,
+                        default=-1, help="Number of parallel jobs")
+    args = parser.parse_args()
+
+    mismatch = main(args.train_path, args.cv_index, n_jobs=args.n_jobs)
+    if mismatch:
+        sys.exit(f"Serial and parallel runs differ: {', '.join(mismatch)}")
@@ -0,0 +1,94 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+# startup budget (seconds) to import each DVC stage entry point
+STARTUP_BUDGET = {"src.data.make_dataset": 1.0,
+                  "src.data.encode_labels": 1.0,
+                  "src.data.replace_nan": 1.0,
+                  "src.features.build_features": 1.5,
+                  "src.features.normalize": 1.0,
+                  "src.data.split_train_dev": 1.5,
+                  "src.models.train_model": 1.5,
+                  "src.models.online": 1.5,
+                  "src.models.compact": 1.5,
+                  "src.models.feature_importance": 1.5,
+                  "src.models.calibrate": 1.5,
+                  "src.models.predict": 1.5}
+
+
+def import_time(module, top_n=10):
+    """Import a module in a fresh interpreter with -X importtime and return
+    the total import time and the slowest top-level packages (in seconds)"""
+    output = subprocess.run([sys.executable, "-X", "importtime",
+                             "-c", f"import {module}"],
+                            capture_output=True, text=True, check=True)
+
+    # lines have the form "import time: self [us] | cumulative | imported package"
+    total = 0.0
+    packages = {}
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, package = line[len("import time:"):].split("|")
+        package = package.strip()
+        cumulative_s = int(cumulative_us) / 1e6
+
+        if package == module:
+            total = cumulative_s
+        elif package.split(".")[0] != module.split(".")[0]:
+            # keep the outermost (largest) import of each top-level package
+            root = package.split(".")[0]
+            packages[root] = max(packages.get(root, 0.0), cumulative_s)
+
+    slowest = sorted(packages.items(), key=lambda elem: elem[1], reverse=True)
+    return {"total": round(total, 4),
+            "slowest": {key: round(val, 4) for key, val in slowest[:top_n]}}
+
+
+def main(modules=None, output_path="results/import_time.json"):
+    """Measure the import time of each stage entry point, save a report and
+    return the modules exceeding their startup budget"""
+    modules = list(STARTUP_BUDGET) if modules is None else modules
+
+    report = {}
+    over_budget = []
+    for module in modules:
+        report[module] = import_time(module)
+        report[module]["budget"] = STARTUP_BUDGET.get(module)
+        if report[module]["budget"] is not None and \
+                report[module]["total"] > report[module]["budget"]:
+            over_budget.append(module)
+
+        print(f"{module}: {report[module]['total']:.3f} s "
+              f"(budget {report[module]['budget']} s)")
+
+    with open(Path(output_path).resolve(), "w") as writer:
+        writer.writelines(json.dumps(report, indent=4))
+
+    return over_budget
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-m", "--modules", dest="modules", nargs="+",
+                        default=None, help="Modules to import (default all stages)")
+    parser.add_argument("-o", "--output", dest="output_path",
+                        default=Path("./results/import_time.json").resolve(),
+                        required=False, help="Output JSON file")
+    args = parser.parse_args()
+
+    over_budget = main(args.modules, args.output_path)
+    if over_budget:
+        sys.exit(f"Startup budget exceeded: {', '.join(over_budget)}")
@@ -0,0 +1,133 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from src.data import encode_labels, make_synthetic, replace_nan, split_train_dev
+from src.features import build_features, normalize
+from src.models import calibrate, compact, feature_importance, predict, train_model
+
+# pipeline stages in order, with the arguments of each main function
+# relative to the benchmark working directory
+STAGES = {"encode_labels": (encode_labels.main,
+                            ["data/raw/train.csv", "data/raw/test.csv", "data/interim"]),
+          "impute_nan": (replace_nan.main,
+                         ["data/interim/train_categorized.csv",
+                          "data/interim/test_categorized.csv", "data/interim"]),
+          "build_features": (build_features.main,
+                             ["data/interim/train_nan_imputed.csv",
+                              "data/interim/test_nan_imputed.csv", "data/interim"]),
+          "normalize_data": (normalize.main,
+                             ["data/interim/train_featurized.csv",
+                              "data/interim/test_featurized.csv", "data/processed"]),
+          "split_train_dev": (split_train_dev.main,
+                              ["data/processed/train_processed.csv", "data/processed"]),
+          "train_model": (train_model.main,
+                          ["data/processed/train_processed.csv",
+                           "data/processed/split_train_dev.csv", "results", "models"]),
+          "compact_model": (compact.main,
+                            ["data/processed/train_processed.csv",
+                             "data/processed/split_train_dev.csv", "results", "models"]),
+          "feature_importance": (feature_importance.main,
+                                 ["data/processed/train_processed.csv",
+                                  "data/processed/split_train_dev.csv", "results", "models"]),
+          "calibrate": (calibrate.main,
+                        ["data/processed/train_processed.csv", "models"]),
+          "predict_output": (predict.main,
+                             ["data/processed/test_processed.csv", "results", "models"])}
+
+
+def git_commit(repo_dir="."):
+    """Return the current git commit hash, or None outside a git repository"""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=repo_dir, stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_pipeline(n_rows, params_path="params.yaml", until=None):
+    """Run the pipeline stages (up to and including stage until) on synthetic
+    data with n_rows training rows in a temporary working directory and
+    return the timing of each stage"""
+    params_path = Path(params_path).resolve()
+    until = list(STAGES)[-1] if until is None else until
+    assert (until in STAGES), KeyError(until)
+    cwd = os.getcwd()
+
+    timing = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        # create directory tree expected by the stages
+        for sub_dir in ["data/raw", "data/interim", "data/processed",
+                        "models", "results"]:
+            os.makedirs(os.path.join(work_dir, sub_dir))
+        shutil.copy(params_path, os.path.join(work_dir, "params.yaml"))
+
+        os.chdir(work_dir)
+        try:
+            start_time = time.perf_counter()
+            make_synthetic.main(n_rows, output_dir="data/raw")
+            timing["make_synthetic"] = {"wall_time": round(time.perf_counter() - start_time, 4)}
+
+            for stage, (stage_fnc, stage_args) in STAGES.items():
+                stage_fnc(*stage_args)
+
+                # each stage main saves its own profile
+                with open(os.path.join("results", f"profile_{stage}.json"), "r") as file:
+                    timing.update(json.load(file))
+
+                if stage == until:
+                    break
+        finally:
+            os.chdir(cwd)
+
+    return timing
+
+
+def main(n_rows_list, output_path="results/benchmark.json",
+         until=None):
+    """Benchmark every stage on synthetic data of increasing size and
+    save the results as JSON for comparison across commits"""
+    output_path = Path(output_path).resolve()
+
+    benchmark = {"commit": git_commit(),
+                 "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                 "results": {}}
+    for n_rows in n_rows_list:
+        print(f"Benchmarking {n_rows} rows")
+        benchmark["results"][str(n_rows)] = run_pipeline(n_rows, until=until)
+
+    with open(output_path, "w") as writer:
+        writer.writelines(json.dumps(benchmark, indent=4))
+
+    return benchmark
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--n-rows", dest="n_rows", type=int, nargs="+",
+                        default=[10 ** 4, 10 ** 5],
+                        help="Number of training rows (e.g. 10000 100000 1000000)")
+    parser.add_argument("-u", "--until", dest="until",
+                        default=None, choices=list(STAGES),
+                        help="Last stage to run (default all stages)")
+    parser.add_argument("-o", "--output", dest="output_path",
+                        default=Path("./results/benchmark.json").resolve(),
+                        required=False, help="Output JSON file")
+    args = parser.parse_args()
+
+    main(args.n_rows, args.output_path, until=args.until)
@@ -0,0 +1,92 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.models.submission import write_submission
+
+
+def read_bytes(filepath):
+    opener = gzip.open if str(filepath).endswith(".gz") else open
+    with opener(filepath, "rb") as file:
+        return file.read()
+
+
+def time_writers(n_rows, compression=None, random_seed=12345):
+    """Write the same submission with DataFrame.to_csv and write_submission
+    and return the wall time of each and whether the contents are identical"""
+    rng = np.random.RandomState(random_seed)
+    index = np.arange(1, n_rows + 1)
+    labels = rng.randint(0, 2, size=n_rows)
+    suffix = ".csv.gz" if compression == "gzip" else ".csv"
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        to_csv_path = os.path.join(work_dir, f"to_csv{suffix}")
+        fast_path = os.path.join(work_dir, f"write_submission{suffix}")
+
+        start_time = time.perf_counter()
+        output_df = pd.DataFrame({"Survived": labels},
+                                 index=pd.Index(index, name="PassengerId"))
+        output_df.to_csv(to_csv_path, compression=compression)
+        to_csv_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        write_submission(index, labels, fast_path, compression=compression)
+        fast_time = time.perf_counter() - start_time
+
+        identical = read_bytes(to_csv_path) == read_bytes(fast_path)
+
+    return {"to_csv": round(to_csv_time, 4),
+            "write_submission": round(fast_time, 4),
+            "speedup": round(to_csv_time / max(fast_time, 1e-9), 2),
+            "identical": identical}
+
+
+def main(n_rows_list, output_path="results/submission_benchmark.json"):
+    """Benchmark write_submission against DataFrame.to_csv, uncompressed and
+    gzip compressed, and save the results as JSON"""
+    report = {}
+    for n_rows in n_rows_list:
+        for compression in [None, "gzip"]:
+            key = f"{n_rows}_{compression or 'none'}"
+            report[key] = time_writers(n_rows, compression=compression)
+            print(f"{n_rows} rows, compression {compression}: "
+                  f"to_csv {report[key]['to_csv']:.3f} s, "
+                  f"write_submission {report[key]['write_submission']:.3f} s "
+                  f"({report[key]['speedup']}x)")
+
+    with open(Path(output_path).resolve(), "w") as writer:
+        writer.writelines(json.dumps(report, indent=4))
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--n-rows", dest="n_rows", type=int, nargs="+",
+                        default=[10 ** 4, 10 ** 6],
+                        help="Number of submission rows")
+    parser.add_argument("-o", "--output", dest="output_path",
+                        default=Path("./results/submission_benchmark.json").resolve(),
+                        required=False, help="Output JSON file")
+    args = parser.parse_args()
+
+    report = main(args.n_rows, args.output_path)
+    if not all(elem["identical"] for elem in report.values()):
+        sys.exit("write_submission output differs from DataFrame.to_csv")
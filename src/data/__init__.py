@@ -7,11 +7,36 @@
 #   Time-stamp: <>
 # ======================================================================
 
+import functools
+import hashlib
+import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import yaml
 
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# profile of the stage currently running (see profile_stage, profile_step)
+_PROFILE = {"stage": None, "steps": {}}
+
+# independent seed streams derived from params.yaml random_seed (see
+# derive_seeds). Append new streams so existing seeds do not change
+SEED_STREAMS = ("split", "fold", "block", "trial", "permutation", "compaction",
+                "threshold")
+
+# background writer for save_as_csv and its pending writes (see wait_for_writes)
+_WRITER = ThreadPoolExecutor(max_workers=4, thread_name_prefix="save_as_csv")
+_PENDING_WRITES = []
+
 
 def load_params(filepath="params.yaml") -> dict:
     """Helper function to load params.yaml
@@ -75,9 +100,16 @@ def load_data(data_path,
     if type(data_path) is str:
         data_path = [data_path]
 
-    # loop over filepath in list and read file
-    output_df = [pd.read_csv(elem, sep=sep, header=header,
-                                     index_col=index_col) for elem in data_path]
+    # read files concurrently (the csv parser releases the GIL)
+    def read_csv(elem):
+        return pd.read_csv(elem, sep=sep, header=header,
+                           index_col=index_col)
+
+    if len(data_path) > 1:
+        with ThreadPoolExecutor(max_workers=len(data_path)) as executor:
+            output_df = list(executor.map(read_csv, data_path))
+    else:
+        output_df = [read_csv(elem) for elem in data_path]
     # if single file as input, return single df not a list
     if len(output_df) == 1:
         output_df = output_df[0]
@@ -85,12 +117,64 @@ def load_data(data_path,
     return output_df
 
 
+def minimize_dtypes(df, float_dtype="float32", record=None):
+    """Downcast numeric columns to the smallest dtype that holds their values:
+    integer-valued columns without NaN (label codes, bins, flags) to
+    (u)int8/16/32 and other float columns to float_dtype. Object and
+    categorical columns are unchanged
+
+    Args:
+        df (pd.DataFrame or list of pd.DataFrame): data, downcast in place
+        float_dtype (str): dtype of continuous columns, None keeps float64
+        record (dict): optional profile record updated with bytes_before,
+            bytes_after and bytes_saved
+
+    Returns:
+        pd.DataFrame or list of pd.DataFrame
+    """
+    output_df = df if type(df) is list else [df]
+
+    bytes_before, bytes_after = 0, 0
+    for temp_df in output_df:
+        bytes_before += int(temp_df.memory_usage(index=True, deep=True).sum())
+        for col in temp_df.columns:
+            values = temp_df[col]
+            if not pd.api.types.is_numeric_dtype(values) or \
+                    pd.api.types.is_bool_dtype(values):
+                continue
+
+            is_integer = pd.api.types.is_integer_dtype(values) or \
+                (values.notna().all() and np.array_equal(values, np.round(values)) and
+                 values.abs().max() <= np.iinfo(np.int32).max)
+            if is_integer and values.shape[0] > 0:
+                downcast = "unsigned" if values.min() >= 0 else "integer"
+                temp_df[col] = pd.to_numeric(values.astype(np.int64), downcast=downcast)
+            elif pd.api.types.is_float_dtype(values) and float_dtype is not None:
+                temp_df[col] = values.astype(float_dtype)
+        bytes_after += int(temp_df.memory_usage(index=True, deep=True).sum())
+
+    if record is not None:
+        record["bytes_before"] = record.get("bytes_before", 0) + bytes_before
+        record["bytes_after"] = record.get("bytes_after", 0) + bytes_after
+        record["bytes_saved"] = record["bytes_before"] - record["bytes_after"]
+
+    return output_df if type(df) is list else output_df[0]
+
+
 def save_as_csv(df, filepath, output_dir,
                 replace_text=".csv",
                 suffix="_processed.csv",
                 na_rep="nan",
-                output_path=False):
-    """Helper function to format the new filename and save output"""
+                output_path=False,
+                compression="infer",
+                blocking=False):
+    """Helper function to format the new filename and save output.
+
+    Files are serialized (and compressed, e.g. for a .gz suffix) by a
+    background thread pool so computation can continue; DataFrames must not
+    be modified after they are passed in. Stage mains decorated with
+    profile_stage wait for pending writes before returning, other callers
+    use wait_for_writes or blocking=True"""
 
     # if single path as str, convert to list of str
 
@@ -103,14 +187,211 @@ def save_as_csv(df, filepath, output_dir,
     # list lengths must be equal
     assert (len(df) == len(filepath)), AssertionError
 
+    save_filepaths = []
     for temp_df, temp_path in zip(df, filepath):
         # set output filenames
         save_fname = os.path.basename(temp_path.replace(replace_text,
                                                         suffix))
 
-        # save updated dataframes
+        # save updated dataframes in the background
         save_filepath = output_dir.joinpath(save_fname)
-        temp_df.to_csv(save_filepath,
-                       na_rep=na_rep)
-        if output_path:
-            return save_filepath
+        _PENDING_WRITES.append(_WRITER.submit(_write_csv, temp_df, save_filepath,
+                                              na_rep=na_rep, compression=compression))
+        save_filepaths.append(save_filepath)
+
+    if blocking:
+        wait_for_writes()
+
+    if output_path:
+        return save_filepaths[0] if len(save_filepaths) == 1 else save_filepaths
+
+
+def _write_csv(df, filepath, na_rep="nan", compression="infer"):
+    """Write to a temporary file in the same directory and rename it, so a
+    file is never seen half-written"""
+    filepath = Path(filepath)
+    tmp_filepath = filepath.with_name(f".tmp_{filepath.name}")
+    df.to_csv(tmp_filepath, na_rep=na_rep, compression=compression)
+    os.replace(tmp_filepath, filepath)
+    return filepath
+
+
+def wait_for_writes():
+    """Block until all pending save_as_csv writes are complete and re-raise
+    the first error of a failed write"""
+    while _PENDING_WRITES:
+        _PENDING_WRITES.pop(0).result()
+
+
+def hash_params(params, length=12) -> str:
+    """Return a short, stable hash of a (nested) parameter dictionary
+
+    Args:
+        params (dict): JSON-serializable parameters
+        length (int): number of hex characters to keep
+
+    Returns:
+        str: hex digest
+    """
+    params_str = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(params_str.encode("utf-8")).hexdigest()[:length]
+
+
+def fingerprint_data(df, length=12) -> str:
+    """Return a short hash of DataFrame contents, including the index
+
+    Args:
+        df (pd.DataFrame): data to fingerprint
+        length (int): number of hex characters to keep
+
+    Returns:
+        str: hex digest
+    """
+    row_hash = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    digest = hashlib.sha1(row_hash.tobytes())
+    digest.update(",".join(map(str, df.columns)).encode("utf-8"))
+    return digest.hexdigest()[:length]
+
+
+def derive_seeds(random_seed, stream, n_seeds) -> list:
+    """Derive independent integer seeds (e.g. one per fold, tree block or
+    trial) from a root seed with np.random.SeedSequence.spawn. A seed only
+    depends on (random_seed, stream, index), never on execution order, so
+    serial and parallel runs use identical seeds
+
+    Args:
+        random_seed (int): root seed (params.yaml random_seed or a derived seed)
+        stream (str): name in SEED_STREAMS
+        n_seeds (int): number of seeds
+
+    Returns:
+        list of int: seeds in [0, 2**32)
+    """
+    stream_seq = np.random.SeedSequence(random_seed,
+                                        spawn_key=(SEED_STREAMS.index(stream),))
+    return [int(child.generate_state(1)[0]) for child in stream_seq.spawn(n_seeds)]
+
+
+def file_checksum(filepath, block_size=2 ** 20) -> str:
+    """Return the sha256 checksum of a file, read in blocks
+
+    Args:
+        filepath (str): path to file
+        block_size (int): number of bytes read at a time
+
+    Returns:
+        str: hex digest
+    """
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of the current process since it started, in MB
+    (nan if unavailable). It is not reset between profiled steps"""
+    if resource is None:
+        return float("nan")
+
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+
+
+def rss_mb() -> float:
+    """Current resident set size of the process in MB (nan if unavailable)"""
+    try:
+        with open("/proc/self/statm", "r") as file:
+            n_pages = int(file.read().split()[1])
+    except (OSError, IndexError, ValueError):  # not available outside Linux
+        return float("nan")
+
+    return round(n_pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 2)
+
+
+def record_shape(record, df):
+    """Add row and column counts of a DataFrame (or list of DataFrames)
+    to a profile record"""
+    if type(df) is not list:
+        df = [df]
+
+    record["rows"] = int(sum(elem.shape[0] for elem in df))
+    record["cols"] = int(max(elem.shape[1] if elem.ndim > 1 else 1 for elem in df))
+    return record
+
+
+@contextmanager
+def profile_step(step, data=None):
+    """Context manager recording wall time, CPU time and the resident set
+    size (RSS) at the start and end of a sub-step (e.g. load, transform,
+    save, fit, predict) of the current stage, and the peak RSS of the
+    process so far. Yields a dict that the caller may update, e.g. with
+    record_shape
+
+    Args:
+        step (str): name of the sub-step
+        data (pd.DataFrame or list): optional data used for row/column counts
+    """
+    record = {}
+    rss_start = rss_mb()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield record
+    finally:
+        record["wall_time"] = round(time.perf_counter() - wall_start, 4)
+        record["cpu_time"] = round(time.process_time() - cpu_start, 4)
+        record["rss_start_mb"] = rss_start
+        record["rss_end_mb"] = rss_mb()
+        record["process_peak_rss_mb"] = peak_rss_mb()
+        if data is not None and "rows" not in record:
+            record_shape(record, data)
+
+        _PROFILE["steps"][step] = record
+
+
+def profile_stage(stage, results_dir="./results"):
+    """Decorator that profiles a stage main function and saves
+    <results_dir>/profile_<stage>.json, tracked as a DVC metric. Background
+    writes of save_as_csv overlap the rest of the stage; their remaining
+    time is recorded as the final wait_for_writes step
+
+    Args:
+        stage (str): name of the DVC stage
+        results_dir (str): output directory for the profile
+    """
+
+    def decorator(fnc):
+        @functools.wraps(fnc)
+        def wrapper(*args, **kwargs):
+            _PROFILE["stage"] = stage
+            _PROFILE["steps"] = {}
+            with profile_step("total"):
+                output = fnc(*args, **kwargs)
+
+                # outputs must be complete when the stage returns
+                with profile_step("wait_for_writes"):
+                    wait_for_writes()
+
+            # save profile
+            save_profile(results_dir)
+            return output
+
+        return wrapper
+
+    return decorator
+
+
+def save_profile(results_dir="./results"):
+    """Write the profile of the current stage to <results_dir>/profile_<stage>.json"""
+    results_dir = Path(results_dir).resolve()
+    results_dir.mkdir(parents=True, exist_ok=True)
+
+    profile_filepath = results_dir.joinpath(f"profile_{_PROFILE['stage']}.json")
+    with open(profile_filepath, "w") as writer:
+        writer.writelines(json.dumps({_PROFILE["stage"]: _PROFILE["steps"]},
+                                     indent=4))
+
+    return profile_filepath
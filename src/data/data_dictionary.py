@@ -14,101 +14,195 @@ from pathlib import Path
 
 import numpy as np
 import pandas as pd
-import yaml
-from tableone import TableOne
 
-from src.data import load_data, load_params
+from src.data import load_params
+from src.data.validate import create_schema, validate_df
 
+# latex template for standalone tables
+TEMPLATE = r'''\documentclass[preview]{{standalone}}
+    \usepackage{{booktabs}}
+    \begin{{document}}
+    {}
+    \end{{document}}
+    '''
 
-def create(data_path, report_dir="./reports/figures",
-           output_file="data_dictionary.tex"):
-    """Create a data dictionary"""
-    assert (os.path.isfile(data_path)), FileNotFoundError
-    assert (os.path.isdir(report_dir)), NotADirectoryError
-    report_dir = Path(report_dir).resolve()
-
-    # read files - do not specify index column
-    df = pd.read_csv(data_path, sep=",", header=0,
-                     na_values=["nan"])
-
-    # load params
-    params = load_params()
-
-    # update params for column data types
-    param_dtypes = params["dtypes"]
-    param_dtypes["Pclass"] = pd.api.types.CategoricalDtype(categories=[1, 2, 3],
-                                                           ordered=True)
-    df = df.astype(param_dtypes)
 
-    # Save information about column names, null count, and dtypes
-    col_list = df.columns.to_list()
-    n_cols = np.arange(0, len(col_list))
-    total_rows = df.shape[0]
-    null_count = total_rows - df.isna().sum()
-    col_dtype = df.dtypes
+def summarize(df):
+    """Compute mergeable summary statistics of a DataFrame (or chunk) in one
+    vectorized pass: row count, non-null counts, min/max/sum/sum of squares
+    of numeric columns and category frequencies of categorical columns"""
+    numeric_df = df.select_dtypes(include="number")
+    categorical_cols = df.columns[df.dtypes == "category"]
+
+    return {"n_rows": df.shape[0],
+            "dtypes": df.dtypes,
+            "non_null": df.notna().sum(),
+            "min": numeric_df.min(),
+            "max": numeric_df.max(),
+            "sum": numeric_df.sum(),
+            "sum_sq": np.square(numeric_df).sum(),
+            "categories": {col: df[col].value_counts(sort=False)
+                           for col in categorical_cols}}
+
+
+def merge_summaries(left, right):
+    """Merge the summary statistics of two chunks"""
+    if left is None:
+        return right
+
+    categories = {}
+    for col in set(left["categories"]) | set(right["categories"]):
+        categories[col] = left["categories"].get(col, pd.Series(dtype=int)).add(
+            right["categories"].get(col, pd.Series(dtype=int)), fill_value=0)
+
+    return {"n_rows": left["n_rows"] + right["n_rows"],
+            "dtypes": left["dtypes"],
+            "non_null": left["non_null"].add(right["non_null"], fill_value=0),
+            "min": pd.concat([left["min"], right["min"]], axis=1).min(axis=1),
+            "max": pd.concat([left["max"], right["max"]], axis=1).max(axis=1),
+            "sum": left["sum"].add(right["sum"], fill_value=0),
+            "sum_sq": left["sum_sq"].add(right["sum_sq"], fill_value=0),
+            "categories": categories}
+
+
+def data_dictionary(summary):
+    """Data dictionary with column names, non-null count, dtypes,
+    data range, categories and ordering"""
+    col_dtype = summary["dtypes"]
+    col_list = col_dtype.index.to_list()
 
-    # additional processing for categorical
     category_list = []
     drange_list = []
     ordered_list = []
     for col, elem in zip(col_list, col_dtype.to_list()):
         if str(elem) in {"category"}:
-            category_list.append(elem.categories.to_list())
-            drange_list.append([df[col].cat.categories.min(),
-                                df[col].cat.categories.max()])
+            # categories observed in the data, sorted as in the dtype
+            counts = summary["categories"][col]
+            categories = [cat for cat in elem.categories if counts.get(cat, 0) > 0] \
+                if elem.ordered else sorted(counts.index[counts > 0].to_list())
+            category_list.append(categories)
+            drange_list.append([min(categories), max(categories)] if categories else "")
             ordered_list.append(str(elem.ordered))
-        elif str(elem) in {"float64", "float32",
-                           "int64", "int64"}:
+        elif col in summary["min"].index:
             category_list.append("")
-            drange_list.append([round(df[col].min(), 2),
-                                round(df[col].max(), 2)])
+            drange_list.append([round(summary["min"][col], 2),
+                                round(summary["max"][col], 2)])
             ordered_list.append("")
         else:
             category_list.append("")
             drange_list.append("")
             ordered_list.append("")
 
-    out_df = pd.DataFrame(data={"#": n_cols, "Column": col_list,
-                                "Non-null count": null_count.to_numpy(),
-                                "Dtype": col_dtype.to_list(),
-                                "Drange": drange_list,
-                                "Categories": category_list,
-                                "Ordered": ordered_list})
-    # write table to latex
-    template = r'''\documentclass[preview]{{standalone}}
-    \usepackage{{booktabs}}
-    \begin{{document}}
-    {}
-    \end{{document}}
-    '''
+    return pd.DataFrame(data={"#": np.arange(0, len(col_list)), "Column": col_list,
+                              "Non-null count": summary["non_null"][col_list].astype(int).to_numpy(),
+                              "Dtype": col_dtype.to_list(),
+                              "Drange": drange_list,
+                              "Categories": category_list,
+                              "Ordered": ordered_list})
+
+
+def summary_table(summary, columns, decimals=None):
+    """TableOne-style summary from merged statistics: mean (SD) for
+    continuous columns and n (%) for each category level"""
+    decimals = {} if decimals is None else decimals
+    n_rows = summary["n_rows"]
+
+    rows = [("n", "", "", str(n_rows))]
+    for col in columns:
+        n_missing = int(n_rows - summary["non_null"][col])
+        if col in summary["categories"]:
+            counts = summary["categories"][col]
+            n_valid = counts.sum()
+            for level_idx, (level, count) in enumerate(counts.items()):
+                rows.append((f"{col}, n (%)", str(level),
+                             str(n_missing) if level_idx == 0 else "",
+                             f"{int(count)} ({100 * count / n_valid:.1f})"))
+        elif col in summary["sum"].index:
+            n_valid = summary["non_null"][col]
+            mean = summary["sum"][col] / n_valid
+            std = np.sqrt(max(summary["sum_sq"][col] - n_valid * mean ** 2, 0) / (n_valid - 1))
+            n_decimals = decimals.get(col, 2)
+            rows.append((f"{col}, mean (SD)", "", str(n_missing),
+                         f"{mean:.{n_decimals}f} ({std:.{n_decimals}f})"))
+
+    return pd.DataFrame(rows, columns=["Variable", "Level", "Missing", "Overall"]) \
+        .set_index(["Variable", "Level"])
+
+
+def render_pdf(tex_files, report_dir):
+    """Convert tex files to PDF with pdflatex. The processes are started in
+    parallel and returned so the caller can wait on them"""
+    if sys.platform != "linux":
+        return []
+
+    return [subprocess.Popen(["pdflatex", "--output-directory",
+                              report_dir, tex_file],
+                             stdout=subprocess.DEVNULL)
+            for tex_file in tex_files if os.path.isfile(tex_file)]
+
 
+def create(data_path, report_dir="./reports/figures",
+           output_file="data_dictionary.tex"):
+    """Create a data dictionary"""
+    assert (os.path.isfile(data_path)), FileNotFoundError
+    assert (os.path.isdir(report_dir)), NotADirectoryError
+    report_dir = Path(report_dir).resolve()
+
+    # load params
+    params = load_params()
+    params_dict = params["data_dictionary"]
+
+    # update params for column data types
+    param_dtypes = params["dtypes"]
+    param_dtypes["Pclass"] = pd.api.types.CategoricalDtype(categories=[1, 2, 3],
+                                                           ordered=True)
+
+    # read files - do not specify index column. TableOne requires
+    # the full DataFrame, otherwise the file is summarized in chunks
+    chunksize = None if params_dict["tableone"] else params_dict["chunksize"]
+    reader = pd.read_csv(data_path, sep=",", header=0,
+                         na_values=["nan"], chunksize=chunksize)
+    if chunksize is None:
+        reader = [reader]
+
+    schema = create_schema(params)
+    summary = None
+    for df in reader:
+        df = validate_df(df, schema).astype(param_dtypes)
+        summary = merge_summaries(summary, summarize(df))
+
+    # write data dictionary to latex
+    out_df = data_dictionary(summary)
     output_file = report_dir.joinpath(output_file)
     with open(output_file, "w") as file:
-        file.write(template.format(out_df.to_latex()))
-
-    # convert tex to PDF
-    if os.path.isfile(output_file) and sys.platform == "linux":
-        subprocess.call(["pdflatex", "--output-directory",
-                         report_dir, output_file])
+        file.write(TEMPLATE.format(out_df.to_latex()))
 
-    # create instance of tableone and save summary statistics
-    summary_df = df.drop(columns=["PassengerId", "Cabin", "Embarked", "Ticket", "Name"])
-    categorical_idx = summary_df.columns[summary_df.dtypes == "category"].to_list()
+    # summary statistics
+    summary_cols = [col for col in summary["dtypes"].index
+                    if col not in ["PassengerId", "Cabin", "Embarked", "Ticket", "Name"]]
     sig_digits = {"Age": 1, "Fare": 2}
-    min_max = ["Parch", "SibSp"]
-    mytable = TableOne(summary_df,
-                       columns=summary_df.columns.to_list(),
-                       categorical=categorical_idx,
-                       decimals=sig_digits,
-                       min_max=min_max)
+    if params_dict["tableone"]:
+        # deferred import - tableone pulls in scipy and statsmodels
+        from tableone import TableOne
+
+        summary_df = df[summary_cols]
+        categorical_idx = summary_df.columns[summary_df.dtypes == "category"].to_list()
+        min_max = ["Parch", "SibSp"]
+        mytable = TableOne(summary_df,
+                           columns=summary_df.columns.to_list(),
+                           categorical=categorical_idx,
+                           decimals=sig_digits,
+                           min_max=min_max)
+    else:
+        mytable = summary_table(summary, summary_cols, decimals=sig_digits)
 
     # save table one
     # write table to latex
     table_filepath = report_dir.joinpath("table_one.tex")
     with open(table_filepath, "w") as file:
-        file.write(template.format(mytable.to_latex()))
+        file.write(TEMPLATE.format(mytable.to_latex()))
 
-    # convert tex to PDF
-    if os.path.isfile(table_filepath) and sys.platform == "linux":
-        subprocess.call(["pdflatex", "--output-directory",
-                         report_dir, table_filepath])
+    # convert tex to PDF in parallel
+    if params_dict["pdf"]:
+        for process in render_pdf([output_file, table_filepath], report_dir):
+            process.wait()
@@ -0,0 +1,202 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import numpy as np
+import pandas as pd
+
+
+def create_sketch(df, bins=10, max_categories=20, sample_size=100000,
+                  random_state=None):
+    """Create per-column sketches of a DataFrame: histogram counts on quantile
+    bin edges for continuous columns, frequencies for columns with at most
+    max_categories levels, and NaN counts. Sketches hold counts only (no raw
+    rows) and are updated or merged in O(n)"""
+    return sketch_blocks(lambda: [df], bins=bins, max_categories=max_categories,
+                         sample_size=sample_size, random_state=random_state)
+
+
+def sketch_blocks(blocks, bins=10, max_categories=20, sample_size=100000,
+                  random_state=None):
+    """Sketch of data read in blocks of rows, in two passes with bounded
+    memory. The first pass collects the levels of each column and a uniform
+    sample of sample_size rows of all blocks, which sets the quantile bin
+    edges; the second pass counts the rows of every block
+
+    Args:
+        blocks (callable): returns an iterable of DataFrames, called once
+            per pass
+        sample_size (int): rows used for the quantile bin edges (all rows
+            if there are fewer)
+        random_state (int): seed of the row sample
+
+    Returns:
+        dict: sketch
+    """
+    rng = np.random.RandomState(random_state)
+
+    # first pass: levels (up to max_categories + 1) and the rows with the
+    # smallest random keys, a uniform sample without replacement
+    levels, sample, sample_keys = {}, None, np.empty(0)
+    for block_df in blocks():
+        for col in block_df.columns:
+            col_levels = levels.get(col, np.empty(0))
+            if col_levels.shape[0] <= max_categories:
+                values = block_df[col].to_numpy(dtype=float)
+                levels[col] = np.union1d(col_levels, np.unique(values[~np.isnan(values)]))
+
+        block_keys = rng.random_sample(block_df.shape[0])
+        sample = block_df if sample is None else pd.concat([sample, block_df])
+        sample_keys = np.concatenate([sample_keys, block_keys])
+        if sample_keys.shape[0] > sample_size:
+            keep = np.argpartition(sample_keys, sample_size)[:sample_size]
+            sample, sample_keys = sample.iloc[keep], sample_keys[keep]
+
+    sketch = {}
+    for col in sample.columns:
+        if levels[col].shape[0] <= max_categories:
+            # negative codes are NaN (see encode_labels)
+            sketch[col] = {"kind": "categorical", "levels": levels[col][levels[col] >= 0]}
+        else:
+            values = sample[col].to_numpy(dtype=float)
+            edges = np.quantile(values[~np.isnan(values)], np.linspace(0, 1, bins + 1)[1:-1])
+            sketch[col] = {"kind": "numeric", "edges": np.unique(edges)}
+
+    # second pass: counts of all rows
+    sketch = empty_sketch(sketch)
+    for block_df in blocks():
+        update_sketch(sketch, block_df)
+
+    return sketch
+
+
+def sketch_array(x, columns, bins=10, max_categories=20, block_size=100000,
+                 sample_size=100000, random_state=None):
+    """Sketch of a 2D array (e.g. a memmap), one block of rows at a time"""
+    def blocks():
+        for start in range(0, x.shape[0], block_size):
+            yield pd.DataFrame(x[start:start + block_size], columns=columns)
+
+    return sketch_blocks(blocks, bins=bins, max_categories=max_categories,
+                         sample_size=sample_size, random_state=random_state)
+
+
+def sketch_csv(filepath, drop_columns=(), bins=10, max_categories=20,
+               block_size=100000, sample_size=100000, random_state=None,
+               index_col="PassengerId"):
+    """Sketch of a CSV file (e.g. the encode_labels output) read in chunks of
+    block_size rows, without the drop_columns (e.g. the target class)"""
+    def blocks():
+        for chunk in pd.read_csv(filepath, sep=",", header=0, index_col=index_col,
+                                 chunksize=block_size):
+            yield chunk.drop(columns=list(drop_columns), errors="ignore")
+
+    return sketch_blocks(blocks, bins=bins, max_categories=max_categories,
+                         sample_size=sample_size, random_state=random_state)
+
+
+def sketch_batch(reference, df):
+    """Sketch of a scoring batch on the bins and levels of the reference.
+    Columns of the reference that are missing from the batch are left out
+    (see compare_sketches)"""
+    return update_sketch(empty_sketch({col: col_sketch for col, col_sketch in reference.items()
+                                       if col in df.columns}), df)
+
+
+def empty_sketch(sketch):
+    """Copy of a sketch with the same bins or levels and zero counts"""
+    output = {}
+    for col, col_sketch in sketch.items():
+        n_bins = col_sketch["edges"].shape[0] + 1 if col_sketch["kind"] == "numeric" \
+            else col_sketch["levels"].shape[0] + 1  # last bin: unseen levels
+        output[col] = {**{key: val for key, val in col_sketch.items()
+                          if key in ("kind", "edges", "levels")},
+                       "counts": np.zeros(n_bins, dtype=np.int64),
+                       "n_nan": 0}
+    return output
+
+
+def update_sketch(sketch, df):
+    """Add the rows of a DataFrame (or chunk) to a sketch in place. Negative
+    codes of categorical columns are counted as NaN"""
+    for col, col_sketch in sketch.items():
+        values = df[col].to_numpy(dtype=float)
+        is_nan = np.isnan(values)
+        if col_sketch["kind"] == "categorical":
+            is_nan |= values < 0
+        values = values[~is_nan]
+
+        if col_sketch["kind"] == "numeric":
+            bin_idx = np.searchsorted(col_sketch["edges"], values, side="right")
+        else:
+            levels = col_sketch["levels"]
+            bin_idx = np.where(np.isin(values, levels),
+                               np.searchsorted(levels, values), levels.shape[0])
+
+        col_sketch["counts"] += np.bincount(bin_idx, minlength=col_sketch["counts"].shape[0])
+        col_sketch["n_nan"] += int(is_nan.sum())
+
+    return sketch
+
+
+def merge_sketches(left, right):
+    """Merge two sketches with the same bins (e.g. of two chunks)"""
+    output = empty_sketch(left)
+    for col in output:
+        output[col]["counts"] = left[col]["counts"] + right[col]["counts"]
+        output[col]["n_nan"] = left[col]["n_nan"] + right[col]["n_nan"]
+
+    return output
+
+
+def psi(expected, actual, eps=1e-4):
+    """Population stability index between two histograms"""
+    expected = np.maximum(expected / max(expected.sum(), 1), eps)
+    actual = np.maximum(actual / max(actual.sum(), 1), eps)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def ks_statistic(expected, actual):
+    """Kolmogorov-Smirnov statistic between two histograms on the same bins
+    (a lower bound of the KS statistic of the underlying samples)"""
+    expected_cdf = np.cumsum(expected) / max(expected.sum(), 1)
+    actual_cdf = np.cumsum(actual) / max(actual.sum(), 1)
+    return float(np.max(np.abs(expected_cdf - actual_cdf)))
+
+
+def nan_rate(col_sketch):
+    n_rows = col_sketch["counts"].sum() + col_sketch["n_nan"]
+    return float(col_sketch["n_nan"] / n_rows) if n_rows > 0 else float("nan")
+
+
+def compare_sketches(reference, batch, psi_threshold=0.2):
+    """Compare a scoring batch to the reference (training) sketch
+
+    Returns:
+        tuple: (summary dict of metrics, DataFrame of per-column PSI, KS
+            statistic and NaN rates)
+    """
+    rows = {}
+    for col, ref_sketch in reference.items():
+        if col not in batch:
+            continue
+        rows[col] = {"psi": psi(ref_sketch["counts"], batch[col]["counts"]),
+                     "ks": ks_statistic(ref_sketch["counts"], batch[col]["counts"]),
+                     "nan_rate_reference": nan_rate(ref_sketch),
+                     "nan_rate_batch": nan_rate(batch[col])}
+    # empty report if the batch shares no columns with the reference
+    drift_df = pd.DataFrame.from_dict(rows, orient="index",
+                                      columns=["psi", "ks", "nan_rate_reference", "nan_rate_batch"])
+
+    summary = {"n_columns": int(drift_df.shape[0]),
+               "n_drifted": int((drift_df["psi"] > psi_threshold).sum()),
+               "max_psi": float(drift_df["psi"].max()),
+               "max_ks": float(drift_df["ks"].max()),
+               "missing_columns": sorted(set(reference) - set(batch))}
+
+    return summary, drift_df
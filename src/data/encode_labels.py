@@ -14,9 +14,11 @@ from pathlib import Path
 import pandas as pd
 import yaml
 
-from src.data import load_data, load_params, save_as_csv
+from src.data import load_data, load_params, profile_stage, profile_step, record_shape, save_as_csv
+from src.data.validate import create_schema, validate_df
 
 
+@profile_stage("encode_labels")
 def main(train_path, test_path,
          output_dir, remove_nan=False,
          label_dict_name="label_encoding.yaml"):
@@ -27,48 +29,61 @@ def main(train_path, test_path,
     assert (os.path.isdir(output_dir)), NotADirectoryError
 
     # load data
-    train_df, test_df = load_data([train_path, test_path], sep=",", header=0,
-                                  index_col="PassengerId")
+    with profile_step("load") as prof:
+        train_df, test_df = load_data([train_path, test_path], sep=",", header=0,
+                                      index_col="PassengerId")
+        record_shape(prof, [train_df, test_df])
 
     # load params
     params = load_params()
+    target_class = params["train_test_split"]["target_class"]
+
+    # fail early on malformed inputs, before astype silently converts
+    # unknown categories to NaN
+    with profile_step("validate"):
+        schema = create_schema(params)
+        validate_df(train_df, schema)
+        validate_df(test_df, schema, optional=[target_class])
 
     # update params for column data types
     param_dtypes = params["dtypes"]
     param_dtypes["Pclass"] = pd.api.types.CategoricalDtype(categories=[1, 2, 3],
                                                            ordered=True)
-    # concatenate df
-    df = pd.concat([train_df, test_df], sort=False)
-    df = df.astype(param_dtypes)
+    with profile_step("transform") as prof:
+        # concatenate df
+        df = pd.concat([train_df, test_df], sort=False)
+        df = df.astype(param_dtypes)
 
-    # drop unnecessary columns
-    df = df.drop(columns=params["drop_cols"])
+        # drop unnecessary columns
+        df = df.drop(columns=params["drop_cols"])
 
-    # convert to categorical
-    encoding_dict = {}
-    for elem, col in zip(df.dtypes, df.columns):
-        if isinstance(elem, pd.CategoricalDtype):
-            # save mapping of category to integer class
-            encoding_dict[col] = {key: val for key, val in enumerate(elem.categories)}
+        # convert to categorical
+        encoding_dict = {}
+        for elem, col in zip(df.dtypes, df.columns):
+            if isinstance(elem, pd.CategoricalDtype):
+                # save mapping of category to integer class
+                encoding_dict[col] = {key: val for key, val in enumerate(elem.categories)}
 
-            # transform to categorical codes
-            df[col] = df[col].cat.codes
+                # transform to categorical codes
+                df[col] = df[col].cat.codes
+        record_shape(prof, df)
 
     # return datasets to train and test
     train_df = df.loc[train_df.index, df.columns]
-    test_df = df.loc[test_df.index, df.columns[1:]]
+    test_df = df.loc[test_df.index, df.columns.drop(target_class)]
 
     # remove nan (if applicable
     if remove_nan:
         train_df = train_df.dropna(axis=0, how="any")
 
     # save data
-    save_as_csv([train_df, test_df],
-                [train_path, test_path],
-                output_dir,
-                replace_text=".csv",
-                suffix="_categorized.csv",
-                na_rep="nan")
+    with profile_step("save", data=[train_df, test_df]):
+        save_as_csv([train_df, test_df],
+                     [train_path, test_path],
+                     output_dir,
+                     replace_text=".csv",
+                     suffix="_categorized.csv",
+                     na_rep="nan")
 
     # save and encoding dictionaries
     encoding_dict = yaml.safe_dump(encoding_dict)
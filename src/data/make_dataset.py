@@ -9,37 +9,104 @@
 
 import argparse
 import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from kaggle.api.kaggle_api_extended import KaggleApi
+from src.data import data_dictionary, file_checksum, load_params, profile_stage, profile_step
 
-from src.data import data_dictionary
 
-
-def download_data(competition, train_data, test_data,
-                  output_dir="./data/raw",
+def kaggle_source(competition, filename, cache_dir,
                   credentials=".kaggle/kaggle.json"):
-    """Download raw dataset from Kaggle"""
-    credentials = Path.home().joinpath(credentials)
-    output_dir = Path(output_dir).resolve()
+    """Download a competition file from Kaggle into cache_dir, unless it is
+    already cached, and return its path"""
+    cache_dir = Path(cache_dir).resolve()
+    cache_path = cache_dir.joinpath(filename)
+    if os.path.isfile(cache_path):
+        return cache_path
 
+    credentials = Path.home().joinpath(credentials)
     assert (os.path.isfile(credentials)), FileNotFoundError(credentials)
-    assert (os.path.isdir(output_dir)), NotADirectoryError(output_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    # deferred import - the kaggle api is slow to import and only needed here
+    from kaggle.api.kaggle_api_extended import KaggleApi
 
     api = KaggleApi()
     api.authenticate()
 
     # downloading from kaggle.com/c/titanic
     api.competition_download_file(competition,
-                                  train_data, path=output_dir)
-    api.competition_download_file(competition,
-                                  test_data, path=output_dir)
+                                  filename, path=cache_dir)
+
+    return cache_path
+
+
+def local_source(competition, filename, cache_dir):
+    """Read a competition file from a local directory or mirror
+    (no network access or credentials required)"""
+    cache_path = Path(cache_dir).resolve().joinpath(filename)
+    assert (os.path.isfile(cache_path)), FileNotFoundError(cache_path)
+
+    return cache_path
+
+
+# map params.yaml data_source.source to functions returning a local file path
+SOURCES = {"kaggle": kaggle_source,
+           "local": local_source}
+
+
+def ingest(source_path, output_dir, checksum=None):
+    """Verify the checksum of a source file and copy it to output_dir,
+    skipping the copy if an identical file already exists"""
+    source_checksum = file_checksum(source_path)
+    if checksum is not None and source_checksum != checksum:
+        raise ValueError(f"Checksum mismatch for {source_path}: "
+                         f"{source_checksum} != {checksum}")
+
+    output_path = Path(output_dir).resolve().joinpath(os.path.basename(source_path))
+    if os.path.isfile(output_path) and file_checksum(output_path) == source_checksum:
+        return output_path
+
+    shutil.copyfile(source_path, output_path)
+    return output_path
+
+
+@profile_stage("make_dataset")
+def main(competition, train_data, test_data,
+         output_dir="./data/raw"):
+    """Fetch raw dataset from the configured source and create the data dictionary"""
+    output_dir = Path(output_dir).resolve()
+    assert (os.path.isdir(output_dir)), NotADirectoryError(output_dir)
+
+    # load params
+    params = load_params()
+    params_source = params["data_source"]
+    if params_source["source"] not in SOURCES:
+        raise NotImplementedError(params_source["source"])
+    fetch = SOURCES[params_source["source"]]
+    cache_dir = Path(params_source["cache_dir"]).joinpath(competition)
+    checksums = params_source["checksums"] or {}
+
+    def fetch_and_ingest(filename):
+        source_path = fetch(competition, filename, cache_dir)
+        return ingest(source_path, output_dir,
+                      checksum=checksums.get(filename))
+
+    # fetch train and test files in parallel
+    with profile_step("download"):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            train_path, test_path = executor.map(fetch_and_ingest,
+                                                 [train_data, test_data])
+
+    with profile_step("data_dictionary"):
+        data_dictionary.create(train_path)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("-c", "--competition", dest="competition",
-                        required=True, help="Kaggle competition to download")
+                        required=True, help="Kaggle competition to download or local mirror subdirectory")
     parser.add_argument("-tr", "--train_data", dest="train_data",
                         required=True, help="Train CSV file")
     parser.add_argument("-te", "--test_data", dest="test_data",
@@ -49,13 +116,6 @@ if __name__ == '__main__':
                         required=False, help="output directory")
     args = parser.parse_args()
 
-    # set vars
-    args.output_dir = Path(args.output_dir).resolve()
-    train_path = args.output_dir.joinpath(args.train_data)
-    test_path = args.output_dir.joinpath(args.test_data)
-
-    # download dataset from kaggle
-    download_data(args.competition, args.train_data, args.test_data,
-                  output_dir=args.output_dir)
-
-    data_dictionary.create(train_path)
+    # fetch dataset and create data dictionary
+    main(args.competition, args.train_data, args.test_data,
+         output_dir=args.output_dir)
@@ -0,0 +1,110 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.data import load_params
+
+# missing value rates observed in the Kaggle Titanic data
+NAN_RATES = {"Age": 0.199, "Fare": 0.0024, "Embarked": 0.0022}
+
+
+def create(n_rows, start_id=1, labels=True,
+           nan_rates=None, random_state=None):
+    """Create a synthetic passenger table with the same schema as the raw
+    Kaggle train/test files (columns, categories and NaN rates). Missing
+    Fare values only occur in the test set, as in the original data.
+
+    Args:
+        n_rows (int): number of passengers
+        start_id (int): first PassengerId
+        labels (bool): include the Survived column (train set)
+        nan_rates (dict): fraction of missing values for Age, Fare and Embarked
+        random_state (int or np.random.RandomState): random seed
+
+    Returns:
+        pd.DataFrame: synthetic passengers
+    """
+    rng = random_state if isinstance(random_state, np.random.RandomState) \
+        else np.random.RandomState(random_state)
+    nan_rates = NAN_RATES if nan_rates is None else nan_rates
+
+    sex = rng.choice(np.array(["male", "female"], dtype=object), n_rows, p=[0.65, 0.35])
+    pclass = rng.choice([1, 2, 3], n_rows, p=[0.24, 0.21, 0.55])
+    age = rng.normal(29.7, 14.5, n_rows).clip(0.42, 80).round(1)
+    sibsp = rng.poisson(0.52, n_rows).clip(0, 8)
+    parch = rng.poisson(0.38, n_rows).clip(0, 6)
+    fare = (rng.lognormal(2.7, 1.0, n_rows) * (4 - pclass) / 2).round(4)
+    embarked = rng.choice(np.array(["S", "C", "Q"], dtype=object), n_rows, p=[0.72, 0.19, 0.09])
+
+    # survival depends on sex and class so that models have signal to learn
+    p_survive = np.where(sex == "female", 0.95, 0.35) - 0.12 * (pclass - 1)
+    survived = (rng.rand(n_rows) < p_survive).astype(int)
+
+    # insert missing values
+    age[rng.rand(n_rows) < nan_rates["Age"]] = np.nan
+    embarked[rng.rand(n_rows) < nan_rates["Embarked"]] = np.nan
+    if not labels:
+        fare[rng.rand(n_rows) < nan_rates["Fare"]] = np.nan
+
+    df = pd.DataFrame({"PassengerId": np.arange(start_id, start_id + n_rows),
+                       "Survived": survived,
+                       "Pclass": pclass,
+                       "Name": "Passenger",
+                       "Sex": sex,
+                       "Age": age,
+                       "SibSp": sibsp,
+                       "Parch": parch,
+                       "Ticket": "0",
+                       "Fare": fare,
+                       "Cabin": np.nan,
+                       "Embarked": embarked})
+
+    return df if labels else df.drop(columns="Survived")
+
+
+def main(n_rows, output_dir="./data/raw",
+         test_fraction=0.47,
+         train_data="train.csv",
+         test_data="test.csv"):
+    """Save synthetic train and test files compatible with params.yaml dtypes"""
+    output_dir = Path(output_dir).resolve()
+    assert (os.path.isdir(output_dir)), NotADirectoryError(output_dir)
+
+    params = load_params()
+    rng = np.random.RandomState(params["random_seed"])
+
+    n_test = max(int(n_rows * test_fraction), 1)
+    train_df = create(n_rows, start_id=1, labels=True, random_state=rng)
+    test_df = create(n_test, start_id=n_rows + 1, labels=False, random_state=rng)
+
+    # check schema against params
+    assert (set(params["dtypes"]).issubset(train_df.columns)), KeyError
+
+    train_df.to_csv(output_dir.joinpath(train_data), index=False, na_rep="")
+    test_df.to_csv(output_dir.joinpath(test_data), index=False, na_rep="")
+
+    return output_dir.joinpath(train_data), output_dir.joinpath(test_data)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--n-rows", dest="n_rows", type=int,
+                        default=891, help="Number of rows in the train set")
+    parser.add_argument("-o", "--out-dir", dest="output_dir",
+                        default=Path("./data/raw").resolve(),
+                        required=False, help="output directory")
+    args = parser.parse_args()
+
+    main(args.n_rows, args.output_dir)
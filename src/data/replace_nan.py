@@ -13,9 +13,11 @@ from pathlib import Path
 
 import yaml
 
-from src.data import load_data, load_params, save_as_csv
+from src.data import load_data, load_params, minimize_dtypes, profile_stage, profile_step, record_shape, save_as_csv
+from src.features.transforms import fit_imputation, impute
 
 
+@profile_stage("impute_nan")
 def main(train_path, test_path,
          output_dir):
     """Split data into train, dev, and test"""
@@ -24,32 +26,39 @@ def main(train_path, test_path,
     assert (os.path.isdir(output_dir)), NotADirectoryError
 
     # load data
-    train_df, test_df = load_data([train_path, test_path], sep=",", header=0,
-                                  index_col="PassengerId")
+    with profile_step("load") as prof:
+        train_df, test_df = load_data([train_path, test_path], sep=",", header=0,
+                                      index_col="PassengerId")
+        record_shape(prof, [train_df, test_df])
 
     # load params
     params = load_params()
 
-    # fill nans with column mean/mode on test set
+    # downcast integer columns to (u)int8 and continuous columns to float32
+    if params["memory"]["minimize_dtypes"]:
+        with profile_step("minimize_dtypes") as prof:
+            train_df, test_df = minimize_dtypes([train_df, test_df],
+                                                float_dtype=params["memory"]["float_dtype"],
+                                                record=prof)
+
+    # fill nans with column mean/mode of the training set
     # TODO - switch to allow for different interpolation methods (e.g., mean, median, MICE)
-    if params["imputation"]["method"].lower() == "mean":
-        mean_age = float(round(train_df["Age"].mean(), 4))
-        mean_fare = float(round(train_df["Fare"].mean(), 4))
-        train_df["Age"].fillna(value=mean_age,
-                               inplace=True)
-        test_df["Age"].fillna(value=mean_age,
-                              inplace=True)
-        test_df["Fare"].fillna(value=mean_fare,
-                              inplace=True)
-
-        # update params and save imputation scheme
-        params["imputation"]["Age"] = mean_age
-        params["imputation"]["Fare"] = mean_fare
-    elif params["imputation"]["method"].lower() == "mice":
-        # TODO MICE interpolation
-        raise NotImplementedError
-    else:
-        raise NotImplementedError
+    with profile_step("transform", data=[train_df, test_df]):
+        imputation = fit_imputation(train_df, method=params["imputation"]["method"])
+        train_df = impute(train_df, imputation)
+        test_df = impute(test_df, imputation)
+
+    # update params and save imputation scheme
+    params["imputation"].update(imputation)
+
+    # save data (written in the background)
+    with profile_step("save", data=[train_df, test_df]):
+        save_as_csv([train_df, test_df],
+                    [train_path, test_path],
+                    output_dir,
+                    replace_text="_categorized.csv",
+                    suffix="_nan_imputed.csv",
+                    na_rep="nan")
 
     # update params
     new_params = yaml.safe_dump(params)
@@ -57,14 +66,6 @@ def main(train_path, test_path,
     with open("params.yaml", "w") as writer:
         writer.write(new_params)
 
-    # save data
-    save_as_csv([train_df, test_df],
-                [train_path, test_path],
-                output_dir,
-                replace_text="_categorized.csv",
-                suffix="_nan_imputed.csv",
-                na_rep="nan")
-
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
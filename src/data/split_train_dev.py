@@ -11,12 +11,14 @@ import argparse
 import os
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import StratifiedKFold
+from sklearn.model_selection import RepeatedStratifiedKFold, StratifiedKFold
 
-from src.data import load_data, load_params
+from src.data import derive_seeds, load_data, load_params, profile_stage, profile_step, record_shape
 
 
+@profile_stage("split_train_dev")
 def main(train_path, output_dir):
     """Split data into train and dev sets"""
 
@@ -24,47 +26,105 @@ def main(train_path, output_dir):
     output_dir = Path(output_dir).resolve()
 
     # read file
-    train_df = load_data(train_path,
-                         sep=",", header=0,
-                         index_col="PassengerId")
+    with profile_step("load") as prof:
+        train_df = load_data(train_path,
+                             sep=",", header=0,
+                             index_col="PassengerId")
+        record_shape(prof, train_df)
 
     # load params
     params = load_params()
     params_split = params['train_test_split']
     params_split["random_seed"] = params["random_seed"]
 
-    # get independent variables (features) and
-    # dependent variables (labels)
-    train_feats = train_df.drop(params_split["target_class"], axis=1)
+    # get dependent variables (labels)
     train_labels = train_df[params_split["target_class"]]
 
-    # K-fold split into train and dev sets stratified by train_labels
-    # using random seed for reproducibility
-    skf = StratifiedKFold(n_splits=params_split['n_split'],
-                          random_state=params_split['random_seed'],
-                          shuffle=params_split['shuffle'])
-
-    # create splits
-    split_df = pd.DataFrame()
-    for n_fold, (train_idx, test_idx) in enumerate(skf.split(train_feats,
-                                                             train_labels)):
-        fold_name = f"fold_{n_fold + 1:02d}"
-
-        # create intermediate dataframe for each fold
-        temp_df = pd.DataFrame({"PassengerId": train_idx,
-                                fold_name: "train"}).set_index("PassengerId")
-        temp_df = temp_df.append(pd.DataFrame({"PassengerId": test_idx,
-                                               fold_name: "test"}).set_index("PassengerId"))
-
-        # append first fold to empty dataframe or join cols if n_fold > 0
-        split_df = split_df.append(temp_df) if n_fold == 0 else split_df.join(temp_df)
-
-    # sort by index
-    split_df = split_df.sort_index()
+    # (repeated) K-fold split into train and dev sets stratified by
+    # train_labels, with optional inner splits for nested cross validation
+    with profile_step("transform") as prof:
+        split_df = create_split_df(train_labels.to_numpy(),
+                                   n_split=params_split["n_split"],
+                                   n_repeats=params_split["n_repeats"],
+                                   n_inner_split=params_split["n_inner_split"],
+                                   shuffle=params_split["shuffle"],
+                                   random_seed=params_split["random_seed"])
+        record_shape(prof, split_df)
 
     # save output dataframe with indices for train and dev sets
-    split_df.to_csv(output_dir.joinpath("split_train_dev.csv"),
-                    na_rep="nan")
+    with profile_step("save", data=split_df):
+        split_df.to_csv(output_dir.joinpath("split_train_dev.csv"),
+                        na_rep="nan")
+
+
+def create_splits(labels, n_split=10, n_repeats=1,
+                  shuffle=True, random_seed=None):
+    """Return a list of (train_idx, test_idx) for stratified K-fold
+    cross validation, repeated n_repeats times with different shuffles"""
+    if n_repeats > 1:
+        skf = RepeatedStratifiedKFold(n_splits=n_split, n_repeats=n_repeats,
+                                      random_state=random_seed)
+    else:
+        # using random seed for reproducibility
+        skf = StratifiedKFold(n_splits=n_split,
+                              random_state=random_seed if shuffle else None,
+                              shuffle=shuffle)
+
+    return list(skf.split(np.zeros(len(labels)), labels))
+
+
+def create_split_df(labels, n_split=10, n_repeats=1,
+                    n_inner_split=None, shuffle=True,
+                    random_seed=None):
+    """Compute all split indices once and return a DataFrame with one column
+    per outer fold (fold_01, ...) and, for nested cross validation, one column
+    per inner fold (fold_01_inner_01, ...) with values train/test (inner
+    columns are empty for the rows in the outer dev set)"""
+    n_rows = len(labels)
+
+    # outer split seed and one seed per outer fold for its inner splits
+    outer_seed, *inner_seeds = derive_seeds(random_seed, "split", 1 + n_split * n_repeats) \
+        if random_seed is not None else [None] * (1 + n_split * n_repeats)
+    outer_splits = create_splits(labels, n_split=n_split, n_repeats=n_repeats,
+                                 shuffle=shuffle, random_seed=outer_seed)
+
+    columns = {}
+    for n_fold, (train_idx, test_idx) in enumerate(outer_splits):
+        fold_name = f"fold_{n_fold + 1:02d}"
+        columns[fold_name] = np.empty(n_rows, dtype=object)
+        columns[fold_name][train_idx] = "train"
+        columns[fold_name][test_idx] = "test"
+
+        # inner splits over the outer training rows
+        if n_inner_split:
+            inner_splits = create_splits(labels[train_idx], n_split=n_inner_split,
+                                         shuffle=shuffle, random_seed=inner_seeds[n_fold])
+            for n_inner, (inner_train, inner_test) in enumerate(inner_splits):
+                inner_col = np.full(n_rows, "", dtype=object)
+                inner_col[train_idx[inner_train]] = "train"
+                inner_col[train_idx[inner_test]] = "test"
+                columns[f"{fold_name}_inner_{n_inner + 1:02d}"] = inner_col
+
+    return pd.DataFrame(columns,
+                        index=pd.RangeIndex(n_rows, name="PassengerId"))
+
+
+def get_splits(cv_idx, outer_fold=None):
+    """Read split indices from the split_train_dev DataFrame.
+
+    Returns a dict of fold name to (train_idx, test_idx) for the outer folds or,
+    if outer_fold is given, for the inner folds of that outer fold with indices
+    relative to its training rows"""
+    if outer_fold is None:
+        fold_cols = [col for col in cv_idx.columns if "_inner_" not in col]
+        return {col: (np.where(cv_idx[col] == "train")[0],
+                      np.where(cv_idx[col] == "test")[0]) for col in fold_cols}
+
+    outer_train = cv_idx[outer_fold].to_numpy() == "train"
+    fold_cols = [col for col in cv_idx.columns if col.startswith(f"{outer_fold}_inner_")]
+    return {col: (np.where(cv_idx[col].to_numpy()[outer_train] == "train")[0],
+                  np.where(cv_idx[col].to_numpy()[outer_train] == "test")[0])
+            for col in fold_cols}
 
 
 if __name__ == '__main__':
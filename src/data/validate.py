@@ -0,0 +1,99 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import numpy as np
+import pandas as pd
+
+
+def create_schema(params):
+    """Schema of the raw data derived from the params.yaml dtypes and
+    the optional categories, ranges and nullable columns in schema"""
+    params_schema = params["schema"]
+    nullable = set(params_schema["nullable"] or [])
+
+    schema = {}
+    for col, dtype in params["dtypes"].items():
+        low, high = (params_schema["ranges"] or {}).get(col, [None, None])
+        schema[col] = {"dtype": str(dtype),
+                       "categories": (params_schema["categories"] or {}).get(col),
+                       "low": -np.inf if low is None else low,
+                       "high": np.inf if high is None else high,
+                       "nullable": col in nullable}
+
+    return schema
+
+
+def validate_df(df, schema, optional=()):
+    """Check the columns, dtypes, categories, ranges and NaN policy of a
+    DataFrame (or chunk) against a schema. Each check is a single vectorized
+    pass over the frame. Raises KeyError, TypeError or ValueError"""
+    missing = [col for col in schema if col not in df.columns and col not in optional]
+    if missing:
+        raise KeyError(f"Missing columns: {missing}")
+    schema = {col: val for col, val in schema.items() if col in df.columns}
+
+    # NaN policy
+    nan_counts = df[list(schema)].isna().sum()
+    nan_cols = [col for col, val in schema.items()
+                if nan_counts[col] > 0 and not val["nullable"]]
+    if nan_cols:
+        raise ValueError(f"Unexpected NaN in columns: {nan_cols}")
+
+    # numeric dtypes
+    numeric_cols = [col for col, val in schema.items() if val["dtype"] in ("int", "float")]
+    wrong_dtype = [col for col in numeric_cols
+                   if not pd.api.types.is_numeric_dtype(df[col])]
+    if wrong_dtype:
+        raise TypeError(f"Expected numeric columns: {wrong_dtype}")
+
+    int_cols = [col for col in numeric_cols if schema[col]["dtype"] == "int"]
+    not_int = df[int_cols].columns[(df[int_cols] % 1 > 0).any()].to_list()
+    if not_int:
+        raise TypeError(f"Expected integer columns: {not_int}")
+
+    # ranges (NaN compares False)
+    low = pd.Series({col: val["low"] for col, val in schema.items()})[numeric_cols]
+    high = pd.Series({col: val["high"] for col, val in schema.items()})[numeric_cols]
+    out_of_range = (df[numeric_cols].lt(low) | df[numeric_cols].gt(high)).any()
+    if out_of_range.any():
+        raise ValueError(f"Values out of range in columns: "
+                         f"{out_of_range.index[out_of_range].to_list()}")
+
+    # categories (astype would silently convert unknown levels to NaN)
+    unknown = [col for col, val in schema.items() if val["categories"] is not None and
+               not (df[col].isin(val["categories"]) | df[col].isna()).all()]
+    if unknown:
+        raise ValueError(f"Unknown categories in columns: {unknown}")
+
+    return df
+
+
+def validate_features(df, target_class=None, n_features=None):
+    """Check that a processed frame is model-ready: all columns numeric and
+    finite, the expected number of features, and binary labels if
+    target_class is given"""
+    feats = df.drop(columns=target_class) if target_class is not None else df
+    if target_class is not None and target_class not in df.columns:
+        raise KeyError(f"Missing target column: {target_class}")
+
+    not_numeric = feats.columns[~feats.dtypes.map(pd.api.types.is_numeric_dtype)].to_list()
+    if not_numeric:
+        raise TypeError(f"Expected numeric columns: {not_numeric}")
+
+    not_finite = feats.columns[~np.isfinite(feats.to_numpy(dtype=float)).all(axis=0)].to_list()
+    if not_finite:
+        raise ValueError(f"NaN or infinite values in columns: {not_finite}")
+
+    if n_features is not None and feats.shape[1] != n_features:
+        raise ValueError(f"Expected {n_features} features, got {feats.shape[1]}")
+
+    if target_class is not None and not df[target_class].isin([0, 1]).all():
+        raise ValueError(f"Expected binary labels in {target_class}")
+
+    return df
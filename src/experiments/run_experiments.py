@@ -0,0 +1,226 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import argparse
+import copy
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+from src.data import hash_params, load_params
+
+
+def get_nested(params, key):
+    """Get a value from a nested dict using a dotted key (e.g. feature_eng.featurize)"""
+    for sub_key in key.split("."):
+        params = params[sub_key]
+    return params
+
+
+def set_nested(params, key, value):
+    """Set a value in a nested dict using a dotted key"""
+    *parents, last_key = key.split(".")
+    for sub_key in parents:
+        params = params.setdefault(sub_key, {})
+    params[last_key] = value
+
+
+def stage_paths(stage_def, section):
+    """Paths listed in the outs or metrics section of a dvc.yaml stage"""
+    return [next(iter(elem)) if isinstance(elem, dict) else elem
+            for elem in stage_def.get(section, [])]
+
+
+def create_grid(grid):
+    """Expand a dict of dotted params keys to lists of values into
+    a list of override dicts (cartesian product)"""
+    keys = list(grid)
+    return [dict(zip(keys, values))
+            for values in itertools.product(*[grid[key] for key in keys])]
+
+
+def _produces(out, dep):
+    """Whether an output path (file or directory) provides a dependency path"""
+    out, dep = out.rstrip("/"), dep.rstrip("/")
+    return out == dep or dep.startswith(out + "/") or out.startswith(dep + "/")
+
+
+def stage_keys(stages, params):
+    """Cache key of each stage: hash of its params, its code dependencies and
+    the keys of the stages producing its data dependencies, so that
+    experiments whose upstream params match share the cached outputs.
+    Stages must be in pipeline order (as in dvc.yaml)"""
+    keys = {}
+    outs = {stage: stage_paths(stage_def, "outs") + stage_paths(stage_def, "metrics")
+            for stage, stage_def in stages.items()}
+    for stage, stage_def in stages.items():
+        stage_params = {key: get_nested(params, key) for key in stage_def.get("params", [])}
+        code_deps = {dep: hash_params(Path(dep).read_text()) for dep in stage_def.get("deps", [])
+                     if dep.endswith(".py") and os.path.isfile(dep)}
+        upstream = sorted({producer for dep in stage_def.get("deps", [])
+                           for producer, producer_outs in outs.items()
+                           if producer != stage and any(_produces(out, dep) for out in producer_outs)})
+        assert (all(producer in keys for producer in upstream)), \
+            ValueError(f"Stage {stage} depends on a later stage")
+        keys[stage] = hash_params({"stage": stage, "params": stage_params, "code": code_deps,
+                                   "upstream": {producer: keys[producer] for producer in upstream}})
+
+    return keys
+
+
+def _link_or_copy(src_path, dst_path):
+    """Hard link a cached file into a work directory, copying if linking fails"""
+    os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+    try:
+        os.link(src_path, dst_path)
+    except OSError:
+        shutil.copy2(src_path, dst_path)
+
+
+def _restore(cache_dir, work_dir):
+    """Restore cached outputs of a stage into a work directory"""
+    for root, _, files in os.walk(cache_dir):
+        for filename in files:
+            src_path = os.path.join(root, filename)
+            _link_or_copy(src_path, os.path.join(work_dir, os.path.relpath(src_path, cache_dir)))
+
+
+def run_stage(job):
+    """Run a single stage in a fresh work directory and save its outputs
+    and metrics to the stage cache. Executed in a worker process"""
+    repo_dir, cache_root = job["repo_dir"], job["cache_root"]
+    cache_dir = os.path.join(cache_root, job["stage"], job["key"])
+    if os.path.isdir(cache_dir):
+        return cache_dir
+
+    with tempfile.TemporaryDirectory(dir=cache_root) as work_dir:
+        # inputs: raw data, code and cached outputs of all upstream stages
+        for path in job["raw_data"]:
+            _link_or_copy(os.path.join(repo_dir, path), os.path.join(work_dir, path))
+        os.symlink(os.path.join(repo_dir, "src"), os.path.join(work_dir, "src"))
+        for upstream_dir in job["upstream_dirs"]:
+            _restore(upstream_dir, work_dir)
+        for path in job["outs"]:
+            os.makedirs(os.path.join(work_dir, os.path.dirname(path) or "."), exist_ok=True)
+        with open(os.path.join(work_dir, "params.yaml"), "w") as writer:
+            writer.write(yaml.safe_dump(job["params"]))
+
+        env = dict(os.environ, PYTHONPATH=work_dir)
+        subprocess.run(job["cmd"], shell=True, cwd=work_dir, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+
+        # move outputs into the cache (rename makes the cache entry atomic)
+        stage_tmp = tempfile.mkdtemp(dir=cache_root)
+        for path in job["outs"]:
+            if os.path.exists(os.path.join(work_dir, path)):
+                os.makedirs(os.path.dirname(os.path.join(stage_tmp, path)), exist_ok=True)
+                shutil.move(os.path.join(work_dir, path), os.path.join(stage_tmp, path))
+        os.makedirs(os.path.dirname(cache_dir), exist_ok=True)
+        os.rename(stage_tmp, cache_dir)
+
+    return cache_dir
+
+
+def main(grid_path, output_path="results/experiments.csv",
+         cache_root="experiments", n_jobs=None,
+         raw_data=("data/raw/train.csv", "data/raw/test.csv")):
+    """Run the DVC pipeline for every combination of params.yaml overrides
+    in grid_path, sharing cached stage outputs between experiments, and
+    save a table comparing their metrics"""
+    repo_dir = os.getcwd()
+    cache_root = Path(cache_root).resolve()
+    cache_root.mkdir(parents=True, exist_ok=True)
+
+    with open(grid_path, "r") as file:
+        overrides = create_grid(yaml.safe_load(file))
+    with open("dvc.yaml", "r") as file:
+        stages = yaml.safe_load(file)["stages"]
+
+    # raw data is provided by the repository, skip the download stage
+    stages = {key: val for key, val in stages.items() if key != "make_dataset"}
+
+    # params and stage cache keys for each experiment
+    base_params = load_params()
+    experiments = []
+    for override in overrides:
+        params = copy.deepcopy(base_params)
+        for key, val in override.items():
+            set_nested(params, key, val)
+        experiments.append({"override": override, "params": params,
+                            "keys": stage_keys(stages, params)})
+
+    # run stages in pipeline order; experiments with the same stage key
+    # share one job and divergent stages run across the process pool
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        upstream = [[] for _ in experiments]
+        for stage, stage_def in stages.items():
+            jobs = {}
+            for exp, upstream_dirs in zip(experiments, upstream):
+                key = exp["keys"][stage]
+                jobs.setdefault(key, {"stage": stage, "key": key,
+                                      "cmd": stage_def["cmd"],
+                                      "outs": stage_paths(stage_def, "outs") +
+                                              stage_paths(stage_def, "metrics"),
+                                      "params": exp["params"],
+                                      "upstream_dirs": list(upstream_dirs),
+                                      "raw_data": list(raw_data),
+                                      "repo_dir": repo_dir,
+                                      "cache_root": str(cache_root)})
+
+            print(f"{stage}: {len(jobs)} unique run(s) for {len(experiments)} experiment(s)")
+            cache_dirs = dict(zip(jobs, executor.map(run_stage, jobs.values())))
+            for exp, upstream_dirs in zip(experiments, upstream):
+                upstream_dirs.append(cache_dirs[exp["keys"][stage]])
+
+    # collect metrics into a single comparison table
+    rows = []
+    for exp, upstream_dirs in zip(experiments, upstream):
+        row = dict(exp["override"])
+        metrics_path = os.path.join(upstream_dirs[list(stages).index("train_model")],
+                                    "results", "metrics.json")
+        with open(metrics_path, "r") as file:
+            row.update(json.load(file))
+        rows.append(row)
+
+    comparison = pd.DataFrame(rows)
+    comparison.to_csv(output_path, index=False)
+    print(comparison.to_string(index=False))
+
+    return comparison
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-g", "--grid", dest="grid_path",
+                        required=True,
+                        help="YAML file mapping params.yaml keys (dotted) to lists of values")
+    parser.add_argument("-o", "--output", dest="output_path",
+                        default=Path("./results/experiments.csv").resolve(),
+                        required=False, help="Output CSV comparing experiments")
+    parser.add_argument("-c", "--cache-dir", dest="cache_root",
+                        default=Path("./experiments").resolve(),
+                        required=False, help="Directory for cached stage outputs")
+    parser.add_argument("-j", "--jobs", dest="n_jobs", type=int,
+                        default=None, help="Number of worker processes")
+    args = parser.parse_args()
+
+    try:
+        main(args.grid_path, args.output_path,
+             cache_root=args.cache_root, n_jobs=args.n_jobs)
+    except subprocess.CalledProcessError as err:
+        sys.exit(f"Stage failed: {err.cmd}")
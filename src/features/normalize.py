@@ -11,9 +11,10 @@ import argparse
 import os
 from pathlib import Path
 
-from src.data import load_data, load_params, save_as_csv
+from src.data import load_data, load_params, profile_stage, profile_step, record_shape, save_as_csv
 
 
+@profile_stage("normalize_data")
 def main(train_path, test_path,
          output_dir):
     """Normalize data"""
@@ -25,8 +26,10 @@ def main(train_path, test_path,
     norm_method = {"min_max", "z_score"}
 
     # load data
-    train_df, test_df = load_data([train_path, test_path], sep=",", header=0,
-                                  index_col="PassengerId")
+    with profile_step("load") as prof:
+        train_df, test_df = load_data([train_path, test_path], sep=",", header=0,
+                                      index_col="PassengerId")
+        record_shape(prof, [train_df, test_df])
 
     # load params
     params = load_params()
@@ -37,12 +40,13 @@ def main(train_path, test_path,
         raise NotImplementedError
 
     # save data
-    save_as_csv([train_df, test_df],
-                [train_path, test_path],
-                output_dir,
-                replace_text="_featurized.csv",
-                suffix="_processed.csv",
-                na_rep="nan")
+    with profile_step("save", data=[train_df, test_df]):
+        save_as_csv([train_df, test_df],
+                    [train_path, test_path],
+                    output_dir,
+                    replace_text="_featurized.csv",
+                    suffix="_processed.csv",
+                    na_rep="nan")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,81 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+
+from src.features.transforms import fit_features, fit_imputation, impute, transform_features
+
+
+class FeatureTransformer(BaseEstimator, TransformerMixin):
+    """Imputation and feature engineering of impute_nan and build_features
+    as one sklearn transformer, so the statistics are fit on the training
+    rows of each cross validation fold only. Input is the encode_labels
+    output (without the target class) as an array with the given columns"""
+
+    def __init__(self, columns=None, impute_method="mean",
+                 featurize=True, drop_features=None):
+        self.columns = columns
+        self.impute_method = impute_method
+        self.featurize = featurize
+        self.drop_features = drop_features
+
+    def _to_df(self, x):
+        return x.copy() if isinstance(x, pd.DataFrame) else \
+            pd.DataFrame(np.asarray(x), columns=self.columns)
+
+    def fit(self, x, y=None):
+        df = self._to_df(x)
+        self.imputation_ = fit_imputation(df, method=self.impute_method)
+        self.feature_stats_ = fit_features(impute(df, self.imputation_)) \
+            if self.featurize else None
+        self.feature_names_out_ = self.transform_df(df.iloc[:1]).columns.to_numpy()
+        return self
+
+    def transform_df(self, x):
+        df = impute(self._to_df(x), self.imputation_)
+        if self.featurize:
+            df = transform_features(df, self.feature_stats_)
+
+        # prune columns without permutation importance (see feature_importance.py)
+        if self.drop_features:
+            df = df.drop(columns=[col for col in self.drop_features
+                                  if col in df.columns])
+        return df
+
+    def transform(self, x):
+        return self.transform_df(x).to_numpy(dtype=np.float32)
+
+    def get_feature_names_out(self, input_features=None):
+        return self.feature_names_out_
+
+
+def fold_transformer(columns, params):
+    """Unfitted FeatureTransformer of the raw columns configured from params.yaml"""
+    return FeatureTransformer(columns=list(columns),
+                              impute_method=params["imputation"]["method"],
+                              featurize=params["feature_eng"]["featurize"],
+                              drop_features=params["feature_eng"]["drop_features"])
+
+
+def fold_pipeline(estimator, columns, params, memory=None):
+    """Pipeline of a FeatureTransformer (configured from params.yaml) and an
+    estimator. Cross validation fits the transformer on the training rows
+    of each fold; with memory (a cache directory) the fitted transformer
+    and transformed features of each fold are computed once and reused"""
+    from sklearn.pipeline import Pipeline
+
+    return Pipeline([("features", fold_transformer(columns, params)), ("model", estimator)],
+                    memory=None if memory is None else str(memory))
+
+
+def is_fold_pipeline(model):
+    """Whether a fitted model is a fold_pipeline, which takes raw features"""
+    return hasattr(model, "steps") and isinstance(model.steps[0][1], FeatureTransformer)
@@ -0,0 +1,124 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import numpy as np
+import pandas as pd
+
+# quantile bins of continuous features (number of bins)
+BINS = {"Age": 10, "Fare": 13, "family_size": 3}
+
+
+def fit_imputation(df, method="mean"):
+    """Fit imputation values of Age and Fare on (training) rows"""
+    if method.lower() == "mean":
+        return {col: float(round(df[col].mean(), 4)) for col in ["Age", "Fare"]}
+    elif method.lower() == "mice":
+        # TODO MICE interpolation
+        raise NotImplementedError
+    else:
+        raise NotImplementedError
+
+
+def impute(df, imputation):
+    """Fill NaN of the imputed columns with the fitted values"""
+    return df.fillna(value={col: val for col, val in imputation.items()
+                            if col in df.columns})
+
+
+def create_poly_features(df, degree=2,
+                         interaction_only=True):
+    from sklearn.preprocessing import PolynomialFeatures
+
+    # create polynomial feature instance
+    poly = PolynomialFeatures(degree=degree,
+                              interaction_only=interaction_only)
+    # at least float32, so products of (u)int8 columns do not overflow
+    x = df.to_numpy(dtype=np.result_type(*df.dtypes, np.float32))
+    poly.fit_transform(x)
+    poly_cols = poly.get_feature_names(df.columns)
+    poly_df = pd.DataFrame(poly.fit_transform(x),
+                           columns=poly_cols).set_index(df.index)
+    return poly_df.drop(columns=poly_cols[0])
+
+
+def fit_features(df):
+    """Fit the data-dependent feature statistics on (training) rows: the
+    Fare threshold of is_vip and the quantile bin edges of BINS"""
+    family_size = df["SibSp"] + df["Parch"] + 1
+    stats = {"vip_fare": float(np.percentile(df["Fare"], 95)), "bins": {}}
+    for col, n_bins in BINS.items():
+        values = family_size if col == "family_size" else df[col]
+        _, edges = pd.qcut(values, n_bins, retbins=True, duplicates="drop")
+        stats["bins"][col] = edges
+
+    return stats
+
+
+def apply_bins(values, edges):
+    """Quantile bin codes of values on fitted edges. Identical to the
+    pd.qcut codes on the fitted rows; values outside the fitted range go
+    to the first or last bin and NaN to -1"""
+    values = np.asarray(values, dtype=float)
+    codes = np.searchsorted(edges[1:-1], values, side="left").astype(np.int8)
+    codes[np.isnan(values)] = -1
+    return codes
+
+
+def transform_features(df, stats):
+    """Polynomial, hand-crafted and binned features using fitted stats"""
+    df = create_poly_features(df, degree=2,
+                              interaction_only=True)
+
+    # hand-crafted features
+    df = hand_crafted_features(df, vip_fare=stats["vip_fare"])
+
+    # bin continuous features
+    for col, edges in stats["bins"].items():
+        df[col] = apply_bins(df[col], edges)
+
+    return df
+
+
+def hand_crafted_features(df, vip_fare):
+    df["family_size"] = df["SibSp"] + df["Parch"] +1
+    df["is_vip"] = is_vip(df, vip_fare)
+    df["parent"] = is_parent(df)
+    df["is_orphan"] = is_orphan(df)
+    df["is_single_adult_mother"] = is_single_adult_mother(df)
+    df["is_single_adult_male"] = is_single_adult_male(df)
+    return df
+
+def is_vip(df, vip_fare):
+    return pd.DataFrame([df["Pclass"] == 1,
+                         df["Fare"] > vip_fare]).transpose().all(axis=1).astype(int)
+
+
+def is_parent(df):
+    return pd.DataFrame([df["Parch"] == 1,
+                         df["Age"] >= 18]).transpose().all(axis=1).astype(int)
+
+
+def is_orphan(df):
+    return pd.DataFrame([df["Parch"] == 0,
+                         df["SibSp"] == 0,
+                         df["Age"] < 18]).transpose().all(axis=1).astype(int)
+
+
+def is_single_adult_mother(df):
+    return pd.DataFrame([df["Parch"] > 0,
+                         df["SibSp"] == 0,
+                         df["Sex"] == 0,
+                         df["Age"] >= 18]).transpose().all(axis=1).astype(int)
+
+
+def is_single_adult_male(df):
+    return pd.DataFrame([df["Parch"] == 0,
+                         df["SibSp"] == 0,
+                         df["Sex"] == 1,
+                         df["Age"] >= 18]).transpose().all(axis=1).astype(int)
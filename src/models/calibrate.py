@@ -0,0 +1,147 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import argparse
+import os
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+from src.data import derive_seeds, fingerprint_data, load_data, load_params, profile_stage, profile_step
+from src.models.metrics import optimal_threshold, score_binary
+from src.models.oof import load_oof, oof_key
+from src.models.out_of_core import fingerprint_csv, stratified_subsample
+
+
+def fit_calibration(y_true, y_score, method="isotonic"):
+    """Fit a probability calibration map (isotonic or Platt scaling)
+    on out-of-fold scores"""
+    if method is None:
+        return None
+    elif method.lower() == "isotonic":
+        from sklearn.isotonic import IsotonicRegression
+        return IsotonicRegression(y_min=0, y_max=1, out_of_bounds="clip").fit(y_score, y_true)
+    elif method.lower() == "platt":
+        from sklearn.linear_model import LogisticRegression
+        return LogisticRegression().fit(_logit(y_score).reshape(-1, 1), y_true)
+    else:
+        raise NotImplementedError(method)
+
+
+def apply_calibration(calibration, y_score):
+    """Apply a fitted calibration artifact to predicted probabilities"""
+    y_score = np.asarray(y_score, dtype=float).ravel()
+    calibrator = calibration["calibrator"]
+
+    if calibrator is None:
+        return y_score
+    elif calibration["method"].lower() == "platt":
+        return calibrator.predict_proba(_logit(y_score).reshape(-1, 1))[:, 1]
+    else:
+        return calibrator.predict(y_score)
+
+
+def validate_threshold(y_true, y_score, metric="accuracy",
+                       min_improvement=0.0, holdout_fraction=0.5,
+                       random_state=None):
+    """Decision threshold maximizing metric on a stratified selection part
+    of the rows. It is kept only if it improves the metric over the default
+    threshold 0.5 by at least min_improvement on the held-out rows,
+    otherwise the threshold is 0.5
+
+    Returns:
+        tuple: (threshold, dict of held-out scores at 0.5 and the tuned threshold)
+    """
+    holdout_mask = np.zeros(y_true.shape[0], dtype=bool)
+    holdout_mask[stratified_subsample(y_true, holdout_fraction, random_state=random_state)] = True
+
+    threshold, _ = optimal_threshold(y_true[~holdout_mask], y_score[~holdout_mask],
+                                     metric=metric)
+    scores = {"score_default": score_binary(y_true[holdout_mask], y_score[holdout_mask],
+                                            threshold=0.5)[metric],
+              "score_tuned": score_binary(y_true[holdout_mask], y_score[holdout_mask],
+                                          threshold=threshold)[metric]}
+    if scores["score_tuned"] - scores["score_default"] < min_improvement:
+        threshold = 0.5
+
+    return threshold, scores
+
+
+def _logit(y_score, eps=1e-6):
+    y_score = np.clip(y_score, eps, 1 - eps)
+    return np.log(y_score / (1 - y_score))
+
+
+@profile_stage("calibrate")
+def main(train_path, model_dir,
+         output_name="calibration.pkl"):
+    """Fit probability calibration and the optimal decision threshold on the
+    cached out-of-fold predictions of the current model (no inference). Both
+    apply to the mean probability of the fold estimators, predict does not
+    use the James-Stein estimate with a calibration that changes either"""
+    assert (os.path.isdir(model_dir)), NotADirectoryError
+    model_dir = Path(model_dir).resolve()
+
+    # load params
+    params = load_params()
+    classifier = params["classifier"]
+    params_calibration = params["calibration"]
+    target_class = params["train_test_split"]["target_class"]
+
+    # load cached out-of-fold predictions of the current train_model run
+    with profile_step("load"):
+        train_df = load_data(train_path, sep=",", header=0,
+                             index_col="PassengerId")
+        # same data hash as train_model (see csv_to_memmap out of core)
+        data_hash = fingerprint_csv(train_path, target_class,
+                                    chunksize=params["training"]["block_size"]) \
+            if params["training"]["out_of_core"] else fingerprint_data(train_df)
+        key = oof_key(classifier, params["model_params"][classifier], params,
+                      data_hash=data_hash)
+        oof_df = load_oof(key, oof_dir=model_dir.joinpath("oof"))
+        assert (oof_df is not None), FileNotFoundError(f"No out-of-fold predictions for {key}")
+
+    # average repeated out-of-fold predictions of each row, like predict
+    # averages the fold estimators
+    y_true = oof_df[target_class].to_numpy()
+    y_score = np.nanmean(oof_df.drop(columns=target_class).to_numpy(dtype=float), axis=1)
+
+    with profile_step("fit", data=oof_df):
+        calibration = {"method": params_calibration["method"],
+                       "calibrator": fit_calibration(y_true, y_score,
+                                                     method=params_calibration["method"]),
+                       "metric": params_calibration["metric"],
+                       "threshold": 0.5}
+
+        # the threshold only moves from 0.5 if that helps on held-out rows
+        if params_calibration["metric"] is not None:
+            threshold, scores = validate_threshold(
+                y_true, apply_calibration(calibration, y_score),
+                metric=params_calibration["metric"],
+                min_improvement=params_calibration["min_improvement"],
+                holdout_fraction=params_calibration["holdout_fraction"],
+                random_state=derive_seeds(params["random_seed"], "threshold", 1)[0])
+            calibration.update(threshold=threshold, **scores)
+
+    with open(model_dir.joinpath(output_name), "wb") as file:
+        pickle.dump(calibration, file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-tr", "--train", dest="train_path",
+                        required=True, help="Train CSV file")
+    parser.add_argument("-md", "--model-dir", dest="model_dir",
+                        default=Path("./models").resolve(),
+                        required=False, help="Model directory")
+    args = parser.parse_args()
+
+    # fit calibration and decision threshold
+    main(args.train_path, args.model_dir)
@@ -0,0 +1,259 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import argparse
+import copy
+import json
+import os
+import pickle
+from pathlib import Path
+
+import numpy as np
+from joblib import Parallel, delayed
+
+from src.data import derive_seeds, load_data, load_params, profile_stage, profile_step
+from src.data.split_train_dev import get_splits
+from src.models.metrics import score_binary
+from src.models.out_of_core import stratified_subsample
+
+TREE_LEAF = -1
+
+
+def prune_leaves(tree, min_leaf_samples):
+    """Collapse splits whose children are both leaves with fewer than
+    min_leaf_samples (weighted) training samples into leaves, bottom-up, and
+    drop unreachable nodes. The sklearn Tree is rebuilt in place through its
+    pickle state"""
+    state = tree.__getstate__()
+    nodes = state["nodes"].copy()
+    left, right = nodes["left_child"], nodes["right_child"]
+    support = nodes["weighted_n_node_samples"]
+
+    # children always have larger node ids than their parent
+    for node in range(nodes.shape[0] - 1, -1, -1):
+        if left[node] == TREE_LEAF:
+            continue
+        tiny_left = left[left[node]] == TREE_LEAF and support[left[node]] < min_leaf_samples
+        tiny_right = left[right[node]] == TREE_LEAF and support[right[node]] < min_leaf_samples
+        if tiny_left and tiny_right:
+            left[node] = right[node] = TREE_LEAF
+
+    # keep reachable nodes (in order) and remap child ids
+    reachable = np.zeros(nodes.shape[0], dtype=bool)
+    depth = np.zeros(nodes.shape[0], dtype=int)
+    reachable[0] = True
+    for node in range(nodes.shape[0]):
+        if reachable[node] and left[node] != TREE_LEAF:
+            reachable[[left[node], right[node]]] = True
+            depth[[left[node], right[node]]] = depth[node] + 1
+
+    new_idx = np.cumsum(reachable) - 1
+    nodes = nodes[reachable]
+    is_split = nodes["left_child"] != TREE_LEAF
+    nodes["left_child"][is_split] = new_idx[nodes["left_child"][is_split]]
+    nodes["right_child"][is_split] = new_idx[nodes["right_child"][is_split]]
+
+    state.update(nodes=nodes, values=state["values"][reachable],
+                 node_count=int(reachable.sum()),
+                 max_depth=int(depth[reachable].max()))
+    tree.__setstate__(state)
+    return tree
+
+
+def select_trees(tree_proba, y_true, holdout_mask,
+                 max_accuracy_loss=0.0, baseline_accuracy=None, min_trees=1):
+    """Ordered aggregation: greedily order the trees by the Brier score of
+    the running ensemble mean on the selection rows (~holdout_mask), then
+    keep the smallest prefix of at least min_trees trees whose accuracy is
+    within max_accuracy_loss of the baseline on both the selection and the
+    held-out rows. If no prefix qualifies (e.g. the baseline is that of
+    another ensemble), all trees are kept
+
+    Args:
+        tree_proba (np.ndarray): n_trees x n_rows positive class probabilities
+        y_true (np.ndarray): binary labels of the out-of-fold rows
+        holdout_mask (np.ndarray): boolean mask of the held-out rows, not
+            used to order the trees
+        baseline_accuracy (tuple): (selection, held-out) accuracy to match,
+            by default that of the full ensemble
+
+    Returns:
+        tuple: (selected tree indices in order of selection, held-out
+            accuracy, whether the selection is within the bound)
+    """
+    n_trees = tree_proba.shape[0]
+    select_proba, y_select = tree_proba[:, ~holdout_mask], y_true[~holdout_mask]
+    holdout_proba, y_holdout = tree_proba[:, holdout_mask], y_true[holdout_mask]
+    if baseline_accuracy is None:
+        baseline_accuracy = (np.mean((select_proba.mean(axis=0) > 0.5) == y_select),
+                             np.mean((holdout_proba.mean(axis=0) > 0.5) == y_holdout))
+
+    # order the trees on the selection rows only
+    order = []
+    remaining = np.ones(n_trees, dtype=bool)
+    running_sum = np.zeros(select_proba.shape[1])
+    for n_selected in range(1, n_trees + 1):
+        candidates = np.flatnonzero(remaining)
+        brier = np.mean(np.square((running_sum + select_proba[candidates]) / n_selected - y_select),
+                        axis=1)
+        best = candidates[np.argmin(brier)]
+
+        order.append(best)
+        remaining[best] = False
+        running_sum += select_proba[best]
+
+    # smallest prefix within the bound on the selection and held-out rows
+    min_trees = min(max(min_trees, 1), n_trees)
+    within_bound = False
+    select_sum = select_proba[order[:min_trees - 1]].sum(axis=0)
+    holdout_sum = holdout_proba[order[:min_trees - 1]].sum(axis=0)
+    for n_keep in range(min_trees, n_trees + 1):
+        select_sum += select_proba[order[n_keep - 1]]
+        holdout_sum += holdout_proba[order[n_keep - 1]]
+        select_accuracy = np.mean((select_sum / n_keep > 0.5) == y_select)
+        holdout_accuracy = np.mean((holdout_sum / n_keep > 0.5) == y_holdout)
+        if select_accuracy >= baseline_accuracy[0] - max_accuracy_loss and \
+                holdout_accuracy >= baseline_accuracy[1] - max_accuracy_loss:
+            within_bound = True
+            break
+
+    return np.array(order[:n_keep]), float(holdout_accuracy), within_bound
+
+
+def compact_fold(model, x_dev, y_dev, min_leaf_samples=None, max_accuracy_loss=0.0,
+                 min_trees=1, holdout_fraction=0.5, random_state=None):
+    """Prune tiny leaves and select a subset of trees of one fold forest.
+    The dev (out-of-fold) rows are split into a stratified selection part,
+    used to order the trees, and a held-out part that bounds the accuracy
+    loss and is reported. The bound is relative to the unpruned forest; if
+    no subset of the pruned trees is within it, the trees are selected from
+    the unpruned forest instead (within_bound false in the report)"""
+    if not hasattr(model, "estimators_"):
+        return model, {"compacted": False}
+
+    holdout_mask = np.zeros(y_dev.shape[0], dtype=bool)
+    holdout_mask[stratified_subsample(y_dev, holdout_fraction, random_state=random_state)] = True
+
+    n_trees, n_nodes = len(model.estimators_), sum(tree.tree_.node_count
+                                                   for tree in model.estimators_)
+    y_proba = model.predict_proba(x_dev)[:, 1]
+    baseline = (score_binary(y_dev[~holdout_mask], y_proba[~holdout_mask])["accuracy"],
+                score_binary(y_dev[holdout_mask], y_proba[holdout_mask])["accuracy"])
+
+    def select(estimators):
+        # one inference pass per tree on the dev rows
+        tree_proba = np.array([tree.predict_proba(x_dev)[:, 1] for tree in estimators])
+        return select_trees(tree_proba, y_dev, holdout_mask,
+                            max_accuracy_loss=max_accuracy_loss,
+                            baseline_accuracy=baseline,
+                            min_trees=min_trees)
+
+    estimators = model.estimators_
+    pruned = bool(min_leaf_samples)
+    if pruned:
+        estimators = copy.deepcopy(model.estimators_)
+        for tree in estimators:
+            prune_leaves(tree.tree_, min_leaf_samples)
+    selected, accuracy, within_bound = select(estimators)
+
+    # the unpruned forest always contains a subset within the bound
+    if not within_bound:
+        estimators, pruned = model.estimators_, False
+        selected, accuracy, _ = select(estimators)
+
+    model.estimators_ = [estimators[idx] for idx in selected]
+    model.n_estimators = len(model.estimators_)
+
+    return model, {"compacted": True,
+                   "pruned": pruned,
+                   "within_bound": within_bound,
+                   "n_trees": [n_trees, model.n_estimators],
+                   "n_nodes": [n_nodes, sum(tree.tree_.node_count for tree in model.estimators_)],
+                   "n_holdout": int(holdout_mask.sum()),
+                   "holdout_accuracy": [baseline[1], accuracy]}
+
+
+@profile_stage("compact_model")
+def main(train_path, cv_idx_path,
+         results_dir, model_dir,
+         model_name="estimator.pkl",
+         output_name="estimator_compact.pkl"):
+    """Compact the fold forests: prune leaves with tiny support and keep the
+    smallest subset of at least compaction.min_trees trees whose held-out
+    out-of-fold accuracy is within compaction.max_accuracy_loss of the full
+    forest"""
+    assert (os.path.isdir(results_dir)), NotADirectoryError
+    assert (os.path.isdir(model_dir)), NotADirectoryError
+    results_dir = Path(results_dir).resolve()
+    model_dir = Path(model_dir).resolve()
+
+    # load estimators and files
+    with profile_step("load"):
+        with open(model_dir.joinpath(model_name), "rb") as model_file:
+            cv_estimators = pickle.load(model_file)
+
+        train_df, cv_idx = load_data([train_path, cv_idx_path],
+                                     sep=",", header=0,
+                                     index_col="PassengerId")
+
+    # load params
+    params = load_params()
+    params_compaction = params["compaction"]
+    target_class = params["train_test_split"]["target_class"]
+
+    x_train = train_df.drop(columns=target_class).to_numpy(dtype=np.float32)
+    y_train = train_df[target_class].to_numpy()
+    cv_splits = list(get_splits(cv_idx).values())
+    assert (len(cv_splits) == len(cv_estimators)), ValueError
+
+    # compact the fold forests in parallel, with one seed per fold for the
+    # split of its dev rows into selection and held-out rows
+    fold_seeds = derive_seeds(params["random_seed"], "compaction", len(cv_splits))
+    with profile_step("compact", data=train_df):
+        fold_output = Parallel(n_jobs=params["training"]["n_jobs"])(
+            delayed(compact_fold)(model, x_train[test_idx], y_train[test_idx],
+                                  min_leaf_samples=params_compaction["min_leaf_samples"],
+                                  max_accuracy_loss=params_compaction["max_accuracy_loss"],
+                                  min_trees=params_compaction["min_trees"],
+                                  holdout_fraction=params_compaction["holdout_fraction"],
+                                  random_state=fold_seed)
+            for model, (_, test_idx), fold_seed in zip(cv_estimators, cv_splits, fold_seeds))
+        cv_estimators = [model for model, _ in fold_output]
+
+    with profile_step("save"):
+        output_filepath = model_dir.joinpath(output_name)
+        with open(output_filepath, "wb") as file:
+            pickle.dump(cv_estimators, file)
+
+    # save report
+    report = {"size_bytes": [os.path.getsize(model_dir.joinpath(model_name)),
+                             os.path.getsize(output_filepath)],
+              "folds": {f"fold_{n_fold + 1:02d}": fold_report
+                        for n_fold, (_, fold_report) in enumerate(fold_output)}}
+    with open(results_dir.joinpath("compaction.json"), "w") as writer:
+        writer.writelines(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-tr", "--train", dest="train_path",
+                        required=True, help="Train CSV file")
+    parser.add_argument("-cv", "--cvindex", dest="cv_index",
+                        required=True, help="CSV file with train/dev split")
+    parser.add_argument("-rd", "--results-dir", dest="results_dir",
+                        default=Path("./results").resolve(),
+                        required=False, help="Output directory for the compaction report")
+    parser.add_argument("-md", "--model-dir", dest="model_dir",
+                        default=Path("./models").resolve(),
+                        required=False, help="Model directory")
+    args = parser.parse_args()
+
+    # compact fold forests
+    main(args.train_path, args.cv_index,
+         args.results_dir, args.model_dir)
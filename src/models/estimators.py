@@ -0,0 +1,134 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import numpy as np
+
+
+def random_forest(model_params, random_state, categorical_features=None):
+    from sklearn.ensemble import RandomForestClassifier
+    return RandomForestClassifier(**model_params,
+                                  random_state=random_state)
+
+
+def negative_codes_to_nan(x, categorical_features=None):
+    """Replace the negative codes (NaN in encode_labels) of categorical
+    columns by NaN"""
+    x = np.array(x, dtype=np.result_type(np.asarray(x).dtype, np.float32))
+    for col in np.flatnonzero(categorical_features):
+        x[x[:, col] < 0, col] = np.nan
+    return x
+
+
+def hist_gradient_boosting(model_params, random_state, categorical_features=None):
+    """Histogram-based gradient boosting. Integer category codes from
+    encode_labels are used natively. Native categories must be non-negative,
+    so the categorical columns first pass through negative_codes_to_nan and
+    missing categories are handled as NaN"""
+    try:
+        from sklearn.ensemble import HistGradientBoostingClassifier
+    except ImportError:
+        # required for scikit-learn < 1.0
+        from sklearn.experimental import enable_hist_gradient_boosting  # noqa: F401
+        from sklearn.ensemble import HistGradientBoostingClassifier
+
+    model = HistGradientBoostingClassifier(**model_params,
+                                           categorical_features=categorical_features
+                                           if np.any(categorical_features) else None,
+                                           random_state=random_state)
+    if not np.any(categorical_features):
+        return model
+
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import FunctionTransformer
+    missing_codes = FunctionTransformer(negative_codes_to_nan,
+                                        kw_args={"categorical_features": categorical_features})
+    return Pipeline([("missing_codes", missing_codes), ("model", model)])
+
+
+def xgboost(model_params, random_state, categorical_features=None):
+    from xgboost import XGBClassifier
+    model_params = {"tree_method": "hist", **model_params}
+    return XGBClassifier(**model_params,
+                         random_state=random_state)
+
+
+def logistic_regression(model_params, random_state, categorical_features=None):
+    from sklearn.linear_model import LogisticRegression
+    return LogisticRegression(**model_params,
+                              random_state=random_state)
+
+
+def naive_bayes(model_params, random_state, categorical_features=None):
+    from sklearn.naive_bayes import GaussianNB
+    return GaussianNB(**model_params)
+
+
+def support_vector_machine(model_params, random_state, categorical_features=None):
+    from sklearn.svm import SVC
+    model_params = {"probability": True, **model_params}
+    return SVC(**model_params,
+               random_state=random_state)
+
+
+def neural_network(model_params, random_state, categorical_features=None):
+    from sklearn.neural_network import MLPClassifier
+    return MLPClassifier(**model_params,
+                         random_state=random_state)
+
+
+# map params.yaml classifier names to estimator factories
+ESTIMATORS = {"random_forest": random_forest,
+              "hist_gradient_boosting": hist_gradient_boosting,
+              "xgboost": xgboost,
+              "logistic_regression": logistic_regression,
+              "naive_bayes": naive_bayes,
+              "support_vector_machine": support_vector_machine,
+              "neural_network": neural_network}
+
+
+def get_estimator(classifier, model_params=None,
+                  random_state=None,
+                  categorical_features=None):
+    """Create an estimator from the registry
+
+    Args:
+        classifier (str): key in ESTIMATORS (params.yaml classifier)
+        model_params (dict or None): params.yaml model_params[classifier]
+        random_state (int): random seed for reproducibility
+        categorical_features (array-like of bool): mask of columns holding
+            integer category codes, used by backends with native support
+
+    Returns:
+        object: unfitted sklearn-compatible estimator
+    """
+    if classifier.lower() not in ESTIMATORS:
+        raise NotImplementedError(classifier)
+
+    model_params = {} if model_params is None else model_params
+
+    return ESTIMATORS[classifier.lower()](model_params, random_state,
+                                          categorical_features=categorical_features)
+
+
+def seed_estimators(estimator, seeds):
+    """Unfitted clones of an estimator, one per seed (e.g. one per fold).
+    Every random_state, including those of pipeline steps, is set to the
+    seed. Estimators without a random_state are cloned unchanged"""
+    from sklearn.base import clone
+    seed_keys = [key for key in estimator.get_params()
+                 if key.split("__")[-1] == "random_state"]
+    return [clone(estimator).set_params(**{key: seed for key in seed_keys})
+            for seed in seeds]
+
+
+def categorical_mask(columns, dtypes, target_class=None):
+    """Boolean mask of feature columns declared as category in params.yaml dtypes"""
+    categorical_cols = {key for key, val in dtypes.items()
+                        if str(val) == "category" and key != target_class}
+    return np.array([col in categorical_cols for col in columns])
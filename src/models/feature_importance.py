@@ -0,0 +1,177 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import argparse
+import json
+import os
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from src.data import derive_seeds, load_data, load_params, minimize_dtypes, profile_stage, profile_step
+from src.data.split_train_dev import get_splits
+from src.features.pipeline import is_fold_pipeline
+from src.models.metrics import score_binary
+
+
+def fold_permutation_importance(model, x_dev, y_dev,
+                                metric="roc_auc", n_repeats=5,
+                                random_state=None):
+    """Permutation importance of each feature on the dev set of one fold.
+    The baseline prediction is computed once and each permuted copy only
+    replaces a single column"""
+    rng = np.random.RandomState(random_state)
+    baseline = score_binary(y_dev, model.predict_proba(x_dev)[:, 1])[metric]
+
+    importances = np.zeros((x_dev.shape[1], n_repeats))
+    x_permuted = x_dev.copy()
+    for col_idx in range(x_dev.shape[1]):
+        for n_repeat in range(n_repeats):
+            x_permuted[:, col_idx] = x_dev[rng.permutation(x_dev.shape[0]), col_idx]
+            scores = score_binary(y_dev, model.predict_proba(x_permuted)[:, 1])
+            importances[col_idx, n_repeat] = baseline - scores[metric]
+
+        # restore column before permuting the next one
+        x_permuted[:, col_idx] = x_dev[:, col_idx]
+
+    return importances.mean(axis=1)
+
+
+@profile_stage("feature_importance")
+def main(train_path, cv_idx_path,
+         results_dir, model_dir,
+         model_name="estimator.pkl",
+         raw_path=None):
+    """Compute impurity and permutation importance across the fold estimators
+    and save the columns to prune to drop_features_candidates.json. Fold
+    pipelines (training.fold_transforms) are evaluated on the features their final
+    estimator sees: the dev rows of each fold are transformed from raw_path
+    (the encode_labels output) by the transformer fit on that fold"""
+    assert (os.path.isdir(results_dir)), NotADirectoryError
+    assert (os.path.isdir(model_dir)), NotADirectoryError
+    results_dir = Path(results_dir).resolve()
+    model_dir = Path(model_dir).resolve()
+
+    # load estimators and files
+    with profile_step("load"):
+        with open(model_dir.joinpath(model_name), "rb") as model_file:
+            cv_estimators = pickle.load(model_file)
+
+        train_df, cv_idx = load_data([train_path, cv_idx_path],
+                                     sep=",", header=0,
+                                     index_col="PassengerId")
+
+        fold_transforms = is_fold_pipeline(cv_estimators[0])
+        if fold_transforms:
+            assert (raw_path is not None), ValueError("Fold pipelines require raw_path")
+            raw_df = load_data(raw_path, sep=",", header=0,
+                               index_col="PassengerId")
+
+    # load params
+    params = load_params()
+    params_importance = params["feature_importance"]
+    target_class = params["train_test_split"]["target_class"]
+
+    # smaller dtypes for the permuted working copies
+    if params["memory"]["minimize_dtypes"]:
+        with profile_step("minimize_dtypes") as prof:
+            train_df = minimize_dtypes(train_df,
+                                       float_dtype=params["memory"]["float_dtype"],
+                                       record=prof)
+
+    train_feats = train_df.drop(target_class, axis=1)
+    y_train = train_df[target_class].to_numpy()
+    cv_splits = list(get_splits(cv_idx).values())
+    assert (len(cv_splits) == len(cv_estimators)), ValueError
+
+    # dev rows of each fold as seen by the (final) fold estimator
+    if fold_transforms:
+        raw_feats = raw_df.loc[train_df.index].drop(columns=target_class)
+        feature_names = cv_estimators[0].steps[0][1].get_feature_names_out()
+        x_dev = [model.steps[0][1].transform(raw_feats.iloc[test_idx])
+                 for model, (_, test_idx) in zip(cv_estimators, cv_splits)]
+        cv_estimators = [model.steps[-1][1] for model in cv_estimators]
+    else:
+        feature_names = train_feats.columns
+        x_train = train_feats.to_numpy()
+        x_dev = [x_train[test_idx] for _, test_idx in cv_splits]
+
+    # impurity importance (tree ensembles only)
+    importance_df = pd.DataFrame(index=pd.Index(feature_names, name="feature"))
+    if all(hasattr(model, "feature_importances_") for model in cv_estimators):
+        impurity = np.array([model.feature_importances_ for model in cv_estimators])
+        importance_df["impurity_mean"] = impurity.mean(axis=0)
+        importance_df["impurity_std"] = impurity.std(axis=0)
+
+    # permutation importance on the dev set of each fold, folds in parallel
+    with profile_step("permutation", data=train_df):
+        permutation = Parallel(n_jobs=params_importance["n_jobs"])(
+            delayed(fold_permutation_importance)(model, fold_x_dev, y_train[test_idx],
+                                                 metric=params_importance["metric"],
+                                                 n_repeats=params_importance["n_repeats"],
+                                                 random_state=seed)
+            for model, fold_x_dev, (_, test_idx), seed in
+            zip(cv_estimators, x_dev, cv_splits,
+                derive_seeds(params["random_seed"], "permutation", len(cv_splits))))
+    permutation = np.array(permutation)
+    importance_df["permutation_mean"] = permutation.mean(axis=0)
+    importance_df["permutation_std"] = permutation.std(axis=0)
+
+    # save importance
+    importance_df = importance_df.sort_values("permutation_mean", ascending=False)
+    importance_df.to_csv(results_dir.joinpath("feature_importance.csv"))
+
+    # columns without any benefit on held-out data are candidates for pruning.
+    # They are only pruned by build_features once copied to
+    # feature_eng.drop_features in params.yaml, so a stage never changes the
+    # inputs of the stages it depends on
+    candidates = []
+    if params_importance["prune"]:
+        candidates = importance_df.index[importance_df["permutation_mean"] <=
+                                         params_importance["prune_threshold"]].to_list()
+        if len(candidates) == importance_df.shape[0]:
+            candidates = []
+
+    # columns dropped by a previous run are no longer in the table, keep them
+    drop_features = sorted(set(params["feature_eng"]["drop_features"] or []) | set(candidates))
+    with open(results_dir.joinpath("drop_features_candidates.json"), "w") as writer:
+        writer.writelines(json.dumps({"metric": params_importance["metric"],
+                                      "prune_threshold": params_importance["prune_threshold"],
+                                      "candidates": candidates,
+                                      "drop_features": drop_features},
+                                     indent=4))
+
+    return importance_df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-tr", "--train", dest="train_path",
+                        required=True, help="Train CSV file")
+    parser.add_argument("-cv", "--cvindex", dest="cv_index",
+                        required=True, help="CSV file with train/dev split")
+    parser.add_argument("-rd", "--results-dir", dest="results_dir",
+                        default=Path("./results").resolve(),
+                        required=False, help="Output directory for feature importance")
+    parser.add_argument("-md", "--model-dir", dest="model_dir",
+                        default=Path("./models").resolve(),
+                        required=False, help="Model directory")
+    parser.add_argument("-raw", "--raw-train", dest="raw_path",
+                        default=None, required=False,
+                        help="Train CSV file before imputation and feature engineering "
+                             "(required for fold pipelines)")
+    args = parser.parse_args()
+
+    # compute feature importance
+    main(args.train_path, args.cv_index,
+         args.results_dir, args.model_dir,
+         raw_path=args.raw_path)
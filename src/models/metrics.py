@@ -7,16 +7,38 @@
 #   Time-stamp: <>
 #   ======================================================================
 
+import time
+
 import numpy as np
 import pandas as pd
-from sklearn.metrics import precision_score, recall_score
+from joblib import Parallel, delayed
+from sklearn.base import clone
+
+
+def confusion_counts(y_true, y_pred):
+    """Compute the binary confusion matrix (tn, fp, fn, tp) in a
+    single bincount pass"""
+    y_true = np.asarray(y_true).astype(int).ravel()
+    y_pred = np.asarray(y_pred).astype(int).ravel()
+    assert (y_true.shape == y_pred.shape), ValueError
+
+    tn, fp, fn, tp = np.bincount(2 * y_true + y_pred, minlength=4)[:4]
+
+    return tn, fp, fn, tp
+
+
+def _safe_divide(numerator, denominator):
+    """Divide two counts, returning 0 when the denominator is 0
+    (matches the sklearn zero_division default)"""
+    return float(numerator) / denominator if denominator > 0 else 0.0
 
 
 def gmpr_score(y_true, y_pred, weights=None):
     """Compute the geometric mean of precision and recall"""
     # TODO - compare with sklearn FM index
-    precision = precision_score(y_true, y_pred, average='binary')
-    recall = recall_score(y_true, y_pred, average='binary')
+    tn, fp, fn, tp = confusion_counts(y_true, y_pred)
+    precision = _safe_divide(tp, tp + fp)
+    recall = _safe_divide(tp, tp + fn)
 
     # update weights parameter and check attributes
     weights = [0.5, 0.5] if weights is None else weights
@@ -24,11 +46,185 @@ def gmpr_score(y_true, y_pred, weights=None):
     assert (len(weights) == 2), TypeError
 
     # compute geometric mean (equally weighted by class)
-    gmpr = np.product(np.power([precision, recall], weights))
+    gmpr = np.prod(np.power([precision, recall], weights))
 
     return gmpr
 
 
+def roc_auc_from_scores(y_true, y_score):
+    """Compute ROC AUC with a single sort of the scores using the
+    Mann-Whitney U statistic (tied scores receive their average rank)"""
+    y_true = np.asarray(y_true).astype(int).ravel()
+    y_score = np.asarray(y_score, dtype=float).ravel()
+
+    n_pos = int(y_true.sum())
+    n_neg = y_true.size - n_pos
+    if n_pos == 0 or n_neg == 0:
+        return np.nan
+
+    # average ranks of tied scores from one sorted pass
+    order = np.argsort(y_score, kind="mergesort")
+    sorted_score = y_score[order]
+    _, first_idx, counts = np.unique(sorted_score, return_index=True,
+                                     return_counts=True)
+    avg_rank = first_idx + (counts + 1) / 2.0
+    ranks = np.empty(y_score.size, dtype=float)
+    ranks[order] = np.repeat(avg_rank, counts)
+
+    u_stat = ranks[y_true == 1].sum() - n_pos * (n_pos + 1) / 2.0
+
+    return u_stat / (n_pos * n_neg)
+
+
+def count_metrics(tn, fp, fn, tp):
+    """Label-based binary classification metrics from confusion counts
+    (which may be accumulated or decayed, e.g. for online learning)"""
+    precision = _safe_divide(tp, tp + fp)
+    recall = _safe_divide(tp, tp + fn)
+    specificity = _safe_divide(tn, tn + fp)
+
+    return {"accuracy": _safe_divide(tp + tn, tn + fp + fn + tp),
+            "balanced_accuracy": (recall + specificity) / 2,
+            "f1": _safe_divide(2 * tp, 2 * tp + fp + fn),
+            "gmpr": float(np.sqrt(precision * recall)),
+            "jaccard": _safe_divide(tp, tp + fp + fn),
+            "precision": precision,
+            "recall": recall}
+
+
+def score_binary(y_true, y_proba, threshold=0.5):
+    """Compute all binary classification metrics from the predicted
+    probability of the positive class. Label-based metrics are derived
+    from one confusion matrix and roc_auc from one sorted-score pass"""
+    y_proba = np.asarray(y_proba, dtype=float).ravel()
+    y_pred = (y_proba > threshold).astype(int)
+
+    return {**count_metrics(*confusion_counts(y_true, y_pred)),
+            "roc_auc": roc_auc_from_scores(y_true, y_proba)}
+
+
+def threshold_sweep(y_true, y_score):
+    """Confusion counts at every distinct decision threshold from a single
+    sort of the scores (O(n log n)). Rows with score > threshold are
+    predicted positive.
+
+    Returns:
+        tuple: thresholds, tp, fp, fn, tn arrays (first entry predicts no positives)
+    """
+    y_true = np.asarray(y_true).astype(int).ravel()
+    y_score = np.asarray(y_score, dtype=float).ravel()
+
+    # sort scores in descending order and accumulate positives/negatives
+    order = np.argsort(-y_score, kind="mergesort")
+    sorted_score = y_score[order]
+    tp_cum = np.cumsum(y_true[order])
+    fp_cum = np.arange(1, y_true.size + 1) - tp_cum
+
+    # last index of each group of tied scores
+    distinct_idx = np.r_[np.where(np.diff(sorted_score))[0], y_true.size - 1]
+
+    # threshold halfway to the next lower score so that all scores in the
+    # group (and above) are strictly greater than the threshold
+    thresholds = np.r_[sorted_score[0],
+                       (sorted_score[distinct_idx[:-1]] + sorted_score[distinct_idx[:-1] + 1]) / 2,
+                       np.nextafter(sorted_score[-1], -np.inf)]
+
+    n_pos = tp_cum[-1]
+    n_neg = fp_cum[-1]
+    tp = np.r_[0, tp_cum[distinct_idx]]
+    fp = np.r_[0, fp_cum[distinct_idx]]
+
+    return thresholds, tp, fp, n_pos - tp, n_neg - fp
+
+
+def optimal_threshold(y_true, y_score, metric="accuracy"):
+    """Decision threshold maximizing accuracy, f1 or gmpr over all distinct
+    thresholds, computed with vectorized sweeps over the sorted scores
+
+    Returns:
+        tuple: (threshold, score)
+    """
+    thresholds, tp, fp, fn, tn = threshold_sweep(y_true, y_score)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        recall = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+        sweep_metrics = {"accuracy": (tp + tn) / (tp + fp + fn + tn),
+                         "f1": np.where(tp > 0, 2 * tp / (2 * tp + fp + fn), 0.0),
+                         "gmpr": np.sqrt(precision * recall)}
+
+    if metric not in sweep_metrics:
+        raise NotImplementedError(metric)
+
+    best_idx = np.argmax(sweep_metrics[metric])
+    return float(thresholds[best_idx]), float(sweep_metrics[metric][best_idx])
+
+
+def _fit_score_fold(fold_model, x, y, train_idx, test_idx, threshold=0.5):
+    """Fit one fold estimator and score it with a single inference pass"""
+    start_time = time.time()
+    fold_model.fit(x[train_idx], y[train_idx])
+    fit_time = time.time() - start_time
+
+    start_time = time.time()
+    y_proba = fold_model.predict_proba(x[test_idx])[:, 1]
+    scores = score_binary(y[test_idx], y_proba,
+                          threshold=threshold)
+    score_time = time.time() - start_time
+
+    return fold_model, fit_time, score_time, y_proba, scores
+
+
+def cross_validate_binary(estimator, x, y, cv,
+                          threshold=0.5,
+                          return_oof=False,
+                          init_estimators=None,
+                          n_jobs=None):
+    """Fused alternative to sklearn cross_validate for binary classifiers.
+    Each fold estimator runs predict_proba once on the dev set and every
+    metric is derived from those probabilities. Returns a dict with the
+    same keys as cross_validate(..., return_estimator=True) and, if
+    return_oof, an "oof_proba" array (n_rows x n_folds, nan outside the
+    dev set of each fold). init_estimators optionally provides one estimator
+    per fold (e.g. fitted forests with warm_start=True) used instead of
+    a fresh clone of estimator. Folds run in parallel with n_jobs; results
+    do not depend on n_jobs as long as each fold estimator is seeded
+    (see estimators.seed_estimators)"""
+    x = np.asarray(x)
+    y = np.asarray(y)
+    cv = list(cv)
+
+    fold_output = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_score_fold)(clone(estimator) if init_estimators is None
+                                 else init_estimators[n_fold],
+                                 x, y, train_idx, test_idx, threshold=threshold)
+        for n_fold, (train_idx, test_idx) in enumerate(cv))
+
+    cv_output = {"fit_time": [], "score_time": [], "estimator": []}
+    oof_proba = []
+    for (train_idx, test_idx), (fold_model, fit_time, score_time, y_proba, scores) \
+            in zip(cv, fold_output):
+        cv_output["fit_time"].append(fit_time)
+        cv_output["score_time"].append(score_time)
+        cv_output["estimator"].append(fold_model)
+        if return_oof:
+            fold_oof = np.full(y.shape[0], np.nan)
+            fold_oof[test_idx] = y_proba
+            oof_proba.append(fold_oof)
+        for key, val in scores.items():
+            cv_output.setdefault(f"test_{key}", []).append(val)
+
+    # convert scores to arrays to match sklearn output
+    for key in cv_output:
+        if key != "estimator":
+            cv_output[key] = np.array(cv_output[key])
+
+    if return_oof:
+        cv_output["oof_proba"] = np.column_stack(oof_proba)
+
+    return cv_output
+
+
 def james_stein(df, limit_shrinkage=True):
     """James-Stein estimator for predictions"""
     assert (type(df) is type(pd.DataFrame())), TypeError
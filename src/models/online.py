@@ -0,0 +1,232 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import argparse
+import json
+import os
+import pickle
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.data import load_data, load_params, profile_stage, profile_step
+from src.data.validate import validate_features
+from src.features.pipeline import FeatureTransformer
+from src.models.metrics import confusion_counts, count_metrics
+
+# fixed score bins of the prequential ROC AUC histograms
+N_SCORE_BINS = 200
+
+
+def sgd_loss(loss):
+    """Name of the logistic loss in the installed scikit-learn: "log" was
+    renamed to "log_loss" in 1.1 (and removed in 1.3)"""
+    import sklearn
+    if loss not in ("log", "log_loss"):
+        return loss
+
+    version = tuple(int(elem) for elem in re.match(r"(\d+)\.(\d+)", sklearn.__version__).groups())
+    return "log_loss" if version >= (1, 1) else "log"
+
+
+def get_online_estimator(params_online, random_state=None):
+    """Linear classifier trained with partial_fit (logistic regression
+    for loss "log"). Averaged SGD keeps the probabilities stable between
+    updates"""
+    from sklearn.linear_model import SGDClassifier
+    return SGDClassifier(loss=sgd_loss(params_online["loss"]),
+                         penalty=params_online["penalty"],
+                         alpha=params_online["alpha"],
+                         average=params_online["average"],
+                         random_state=random_state)
+
+
+def stream_batches(stream_path, chunksize=1000, index_col="PassengerId"):
+    """Yield labeled rows in chunks from a CSV file or stdin ("-"), so only
+    one chunk is held in memory"""
+    source = sys.stdin if str(stream_path) == "-" else stream_path
+    for chunk in pd.read_csv(source, sep=",", header=0, index_col=index_col,
+                             chunksize=chunksize):
+        yield chunk
+
+
+def empty_state():
+    """Prequential (test-then-train) metric state of fixed size: cumulative
+    and exponentially faded confusion counts, log loss and per-class score
+    histograms for ROC AUC"""
+    return {"n_rows": 0,
+            "n_scored": 0,
+            "counts": np.zeros(4),
+            "faded_counts": np.zeros(4),
+            "log_loss_sum": 0.0,
+            "score_hist": np.zeros((2, N_SCORE_BINS))}
+
+
+def update_state(state, y_true, y_proba, fading_factor=0.999, threshold=0.5):
+    """Add the predictions of a batch, made before training on it"""
+    y_true = np.asarray(y_true).astype(int)
+    counts = np.array(confusion_counts(y_true, y_proba > threshold), dtype=float)
+
+    state["n_scored"] += y_true.shape[0]
+    state["counts"] += counts
+    state["faded_counts"] = state["faded_counts"] * fading_factor ** y_true.shape[0] + counts
+
+    y_proba = np.clip(y_proba, 1e-15, 1 - 1e-15)
+    state["log_loss_sum"] += float(-np.sum(y_true * np.log(y_proba) +
+                                           (1 - y_true) * np.log(1 - y_proba)))
+
+    bin_idx = np.minimum((y_proba * N_SCORE_BINS).astype(int), N_SCORE_BINS - 1)
+    np.add.at(state["score_hist"], (y_true, bin_idx), 1)
+    return state
+
+
+def histogram_auc(score_hist):
+    """ROC AUC from per-class score histograms (ties within a bin count half)"""
+    neg_hist, pos_hist = score_hist
+    if neg_hist.sum() == 0 or pos_hist.sum() == 0:
+        return float("nan")
+
+    neg_below = np.cumsum(neg_hist) - neg_hist
+    return float(np.sum(pos_hist * (neg_below + neg_hist / 2)) /
+                 (pos_hist.sum() * neg_hist.sum()))
+
+
+def state_metrics(state):
+    """Prequential metrics (cumulative and faded) of the current state"""
+    return {"n_rows": int(state["n_rows"]),
+            "n_scored": int(state["n_scored"]),
+            **count_metrics(*state["counts"]),
+            "roc_auc": histogram_auc(state["score_hist"]),
+            "log_loss": state["log_loss_sum"] / max(state["n_scored"], 1),
+            "faded_accuracy": count_metrics(*state["faded_counts"])["accuracy"]}
+
+
+def learn_batch(learner, batch_df, target_class, fading_factor=0.999):
+    """Test-then-train on one batch: score the rows with the current model,
+    then update the scaler and the model with partial_fit. Rows seen before
+    the first update are scored with a prior probability of 0.5"""
+    x = learner["transformer"].transform(batch_df.drop(columns=target_class))
+    validate_features(pd.DataFrame(x))
+    y = batch_df[target_class].to_numpy().astype(int)
+
+    if hasattr(learner["model"], "coef_"):
+        y_proba = learner["model"].predict_proba(learner["scaler"].transform(x))[:, 1]
+    else:
+        y_proba = np.full(y.shape[0], 0.5)
+    update_state(learner["state"], y, y_proba, fading_factor=fading_factor)
+
+    learner["scaler"].partial_fit(x)
+    learner["model"].partial_fit(learner["scaler"].transform(x), y, classes=[0, 1])
+    learner["state"]["n_rows"] += y.shape[0]
+    return learner
+
+
+def save_checkpoint(learner, filepath):
+    """Pickle the learner to a temporary file and rename it"""
+    filepath = Path(filepath)
+    tmp_filepath = filepath.with_name(f".tmp_{filepath.name}")
+    with open(tmp_filepath, "wb") as file:
+        pickle.dump(learner, file)
+    os.replace(tmp_filepath, filepath)
+
+
+@profile_stage("train_online")
+def main(train_path, stream_path,
+         results_dir, model_dir,
+         checkpoint_name="online_estimator.pkl"):
+    """Update an online classifier from a stream of labeled rows (encode_labels
+    format) with bounded memory. The preprocessing is a FeatureTransformer
+    fit once on train_path; the model is checkpointed periodically and
+    evaluated prequentially next to the batch metrics.json"""
+    assert (os.path.isdir(results_dir)), NotADirectoryError
+    assert (os.path.isdir(model_dir)), NotADirectoryError
+    results_dir = Path(results_dir).resolve()
+    model_dir = Path(model_dir).resolve()
+    checkpoint_filepath = model_dir.joinpath(checkpoint_name)
+
+    # load params
+    params = load_params()
+    params_online = params["online"]
+    target_class = params["train_test_split"]["target_class"]
+
+    # resume from the last checkpoint or fit the preprocessing transformer
+    with profile_step("init"):
+        if params_online["resume"] and os.path.isfile(checkpoint_filepath):
+            with open(checkpoint_filepath, "rb") as file:
+                learner = pickle.load(file)
+        else:
+            from sklearn.preprocessing import StandardScaler
+
+            train_feats = load_data(train_path, sep=",", header=0,
+                                    index_col="PassengerId").drop(columns=target_class)
+            transformer = FeatureTransformer(columns=list(train_feats.columns),
+                                             impute_method=params["imputation"]["method"],
+                                             featurize=params["feature_eng"]["featurize"],
+                                             drop_features=params["feature_eng"]["drop_features"])
+            learner = {"transformer": transformer.fit(train_feats),
+                       "scaler": StandardScaler(),
+                       "model": get_online_estimator(params_online,
+                                                     random_state=params["random_seed"]),
+                       "state": empty_state()}
+
+    # test-then-train on each batch, checkpoint every checkpoint_every rows
+    curve = []
+    last_checkpoint = learner["state"]["n_rows"]
+    with profile_step("stream") as prof:
+        for batch_df in stream_batches(stream_path, chunksize=params_online["chunksize"]):
+            learn_batch(learner, batch_df, target_class,
+                        fading_factor=params_online["fading_factor"])
+
+            if learner["state"]["n_rows"] - last_checkpoint >= params_online["checkpoint_every"]:
+                save_checkpoint(learner, checkpoint_filepath)
+                last_checkpoint = learner["state"]["n_rows"]
+                curve.append(state_metrics(learner["state"]))
+        prof["rows"] = int(learner["state"]["n_rows"])
+
+    with profile_step("save"):
+        save_checkpoint(learner, checkpoint_filepath)
+        if not curve or curve[-1]["n_rows"] != learner["state"]["n_rows"]:
+            curve.append(state_metrics(learner["state"]))
+        pd.DataFrame(curve).to_csv(results_dir.joinpath("online_prequential.csv"),
+                                   index=False)
+
+    # prequential metrics next to the batch cross validation metrics
+    report = {"prequential": curve[-1]}
+    batch_metrics_filepath = results_dir.joinpath("metrics.json")
+    if os.path.isfile(batch_metrics_filepath):
+        with open(batch_metrics_filepath, "r") as file:
+            report["batch"] = json.load(file)
+    with open(results_dir.joinpath("online_metrics.json"), "w") as writer:
+        writer.writelines(json.dumps(report, indent=4))
+
+    return learner
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-tr", "--train", dest="train_path",
+                        required=True,
+                        help="Train CSV file (encode_labels output) to fit the preprocessing")
+    parser.add_argument("-st", "--stream", dest="stream_path",
+                        required=True,
+                        help="CSV file of labeled rows (encode_labels format) or - for stdin")
+    parser.add_argument("-rd", "--results-dir", dest="results_dir",
+                        default=Path("./results").resolve(),
+                        required=False, help="Metrics output directory")
+    parser.add_argument("-md", "--model-dir", dest="model_dir",
+                        default=Path("./models").resolve(),
+                        required=False, help="Model output directory")
+    args = parser.parse_args()
+
+    # update the online model from the stream
+    main(args.train_path, args.stream_path,
+         args.results_dir, args.model_dir)
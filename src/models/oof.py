@@ -0,0 +1,96 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.data import hash_params
+from src.models.metrics import score_binary
+
+
+def oof_key(classifier, model_params, params, data_hash=None,
+            training_settings=True) -> str:
+    """Hash of everything that determines the out-of-fold predictions:
+    classifier, model params, random seed, CV split settings and data.
+    With training_settings=False (e.g. param_tuning, which always fits in memory
+    on the processed features) the training.out_of_core and
+    training.fold_transforms settings are ignored"""
+    key = {"classifier": classifier,
+           "model_params": model_params,
+           "random_seed": params["random_seed"],
+           "train_test_split": params["train_test_split"],
+           "data": data_hash}
+
+    # block-wise training changes the fitted forests
+    params_training = params["training"]
+    if training_settings and params_training["out_of_core"]:
+        key["out_of_core"] = {"block_size": params_training["block_size"],
+                              "subsample": params_training["subsample"]}
+
+    # preprocessing fit per fold changes the features of each fold
+    if training_settings and params_training["fold_transforms"]:
+        key["fold_transforms"] = {"imputation": params["imputation"]["method"],
+                                  "feature_eng": params["feature_eng"]}
+
+    return hash_params(key)
+
+
+def create_oof_df(oof_proba, index, labels,
+                  fold_names, target_class="Survived"):
+    """Create a DataFrame indexed by PassengerId with the target class and
+    one column of out-of-fold probabilities per fold model (nan for rows
+    that were used to train that fold)"""
+    assert (oof_proba.shape == (len(index), len(fold_names))), ValueError
+
+    oof_df = pd.DataFrame(oof_proba.astype(np.float32),
+                          columns=fold_names,
+                          index=pd.Index(index, name="PassengerId"))
+    oof_df.insert(loc=0, column=target_class,
+                  value=np.asarray(labels).astype(np.int8))
+
+    return oof_df
+
+
+def save_oof(oof_df, key, oof_dir="./models/oof"):
+    """Save out-of-fold predictions as <oof_dir>/<key>.pkl"""
+    oof_dir = Path(oof_dir).resolve()
+    oof_dir.mkdir(parents=True, exist_ok=True)
+
+    oof_filepath = oof_dir.joinpath(f"{key}.pkl")
+    oof_df.to_pickle(oof_filepath)
+
+    return oof_filepath
+
+
+def load_oof(key, oof_dir="./models/oof"):
+    """Load cached out-of-fold predictions, or None if the key is missing"""
+    oof_filepath = Path(oof_dir).resolve().joinpath(f"{key}.pkl")
+    if not os.path.isfile(oof_filepath):
+        return None
+
+    return pd.read_pickle(oof_filepath)
+
+
+def score_oof(oof_df, target_class="Survived",
+              threshold=0.5):
+    """Compute per-fold metrics from cached out-of-fold predictions,
+    equivalent to the metrics computed during cross validation"""
+    labels = oof_df[target_class].to_numpy()
+
+    fold_scores = []
+    for col in oof_df.columns.drop(target_class):
+        fold_proba = oof_df[col].to_numpy()
+        mask = ~np.isnan(fold_proba)
+        fold_scores.append(score_binary(labels[mask], fold_proba[mask],
+                                        threshold=threshold))
+
+    return pd.DataFrame(fold_scores)
@@ -0,0 +1,201 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import hashlib
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.model_selection import StratifiedKFold
+
+from src.data import derive_seeds
+from src.data.validate import validate_features
+from src.models.metrics import score_binary
+
+
+def read_chunks(data_path, target_class, chunksize=100000, index_col="PassengerId"):
+    """Read a processed CSV file in chunks with float32 features, the dtype
+    of the memmap, so the values and dtypes of a row do not depend on the
+    other rows of its chunk
+
+    Returns:
+        tuple: (columns, iterator of DataFrames)
+    """
+    columns = pd.read_csv(data_path, nrows=0, index_col=index_col).columns
+    return columns, pd.read_csv(data_path, sep=",", header=0, index_col=index_col,
+                                dtype={col: np.float32 for col in columns.drop(target_class)},
+                                chunksize=chunksize)
+
+
+def fingerprint_csv(data_path, target_class, chunksize=100000, index_col="PassengerId"):
+    """Data hash of a processed CSV file as computed by csv_to_memmap, i.e.
+    fingerprint_data of the file read with float32 features"""
+    columns, chunks = read_chunks(data_path, target_class,
+                                  chunksize=chunksize, index_col=index_col)
+    digest = hashlib.sha1()
+    for chunk in chunks:
+        digest.update(pd.util.hash_pandas_object(chunk, index=True).to_numpy().tobytes())
+    digest.update(",".join(map(str, columns)).encode("utf-8"))
+
+    return digest.hexdigest()[:12]
+
+
+def csv_to_memmap(data_path, memmap_path, target_class,
+                  chunksize=100000, index_col="PassengerId"):
+    """Convert a processed CSV file into a float32 memmap of the features,
+    reading and validating one chunk at a time. Only the labels and index
+    are kept in memory
+
+    Returns:
+        tuple: (memmap, labels Series, feature columns, data hash). The data
+            hash is identical to fingerprint_csv of the file
+    """
+    with open(data_path, "r") as file:
+        n_rows = sum(1 for _ in file) - 1
+
+    columns, chunks = read_chunks(data_path, target_class,
+                                  chunksize=chunksize, index_col=index_col)
+    feature_cols = columns.drop(target_class)
+    x_memmap = np.lib.format.open_memmap(memmap_path, mode="w+", dtype=np.float32,
+                                         shape=(n_rows, len(feature_cols)))
+
+    digest = hashlib.sha1()
+    labels = []
+    start = 0
+    for chunk in chunks:
+        chunk = validate_features(chunk, target_class=target_class)
+
+        digest.update(pd.util.hash_pandas_object(chunk, index=True).to_numpy().tobytes())
+        labels.append(chunk[target_class])
+        x_memmap[start:start + chunk.shape[0]] = chunk[feature_cols].to_numpy(dtype=np.float32)
+        start += chunk.shape[0]
+
+    x_memmap.flush()
+    digest.update(",".join(map(str, columns)).encode("utf-8"))
+
+    return x_memmap, pd.concat(labels), feature_cols, digest.hexdigest()[:12]
+
+
+def stratified_subsample(y, fraction, random_state=None):
+    """Sorted indices of a class-stratified random subsample of y"""
+    rng = np.random.RandomState(random_state)
+    subsample_idx = []
+    for label in np.unique(y):
+        label_idx = np.flatnonzero(y == label)
+        n_samples = max(1, int(round(fraction * label_idx.shape[0])))
+        subsample_idx.append(rng.choice(label_idx, size=n_samples, replace=False))
+
+    return np.sort(np.concatenate(subsample_idx))
+
+
+def merge_forests(forests):
+    """Merge fitted forests (sub-ensembles) into one forest"""
+    merged = forests[0]
+    for forest in forests[1:]:
+        assert (np.array_equal(forest.classes_, merged.classes_)), ValueError
+        merged.estimators_ += forest.estimators_
+    merged.n_estimators = len(merged.estimators_)
+
+    return merged
+
+
+def fit_blocks(estimator, x, y, train_idx,
+               block_size=100000, subsample=1.0,
+               random_state=None):
+    """Fit a forest on rows train_idx of a (memmapped) array, one block of
+    rows at a time. The rows are split into stratified blocks, each block is
+    subsampled per class and fits a sub-ensemble with its share of the
+    trees. Only one block is held in memory at a time"""
+    model_params = estimator.get_params()
+    if "n_estimators" not in model_params or "bootstrap" not in model_params:
+        raise NotImplementedError(f"Out-of-core training requires a forest, "
+                                  f"got {type(estimator).__name__}")
+
+    n_blocks = int(np.ceil(train_idx.shape[0] / block_size))
+    if model_params["n_estimators"] < n_blocks:
+        raise ValueError(f"n_estimators must be at least the number of blocks ({n_blocks})")
+
+    # seeds of the block split and of each block (subsample and forest)
+    block_split_seed, *block_seeds = derive_seeds(random_state, "block", 1 + n_blocks)
+    if n_blocks > 1:
+        block_split = StratifiedKFold(n_splits=n_blocks, shuffle=True,
+                                      random_state=block_split_seed)
+        blocks = [train_idx[block_idx] for _, block_idx in
+                  block_split.split(np.zeros(train_idx.shape[0]), y[train_idx])]
+    else:
+        blocks = [train_idx]
+    n_trees = [len(elem) for elem in np.array_split(np.arange(model_params["n_estimators"]),
+                                                    n_blocks)]
+
+    forests = []
+    for block_idx, block_trees, block_seed in zip(blocks, n_trees, block_seeds):
+        subsample_seed, forest_seed = derive_seeds(block_seed, "block", 2)
+        block_idx = block_idx[stratified_subsample(y[block_idx], subsample,
+                                                   random_state=subsample_seed)]
+        forest = clone(estimator).set_params(n_estimators=block_trees,
+                                             random_state=forest_seed)
+        forests.append(forest.fit(x[block_idx], y[block_idx]))
+
+    return merge_forests(forests)
+
+
+def predict_proba_blocks(model, x, idx, block_size=100000):
+    """Positive class probability for rows idx of a (memmapped) array,
+    predicted one block of rows at a time"""
+    return np.concatenate([model.predict_proba(x[idx[start:start + block_size]])[:, 1]
+                           for start in range(0, idx.shape[0], block_size)])
+
+
+def cross_validate_blocks(estimator, x, y, cv,
+                          block_size=100000, subsample=1.0,
+                          threshold=0.5, return_oof=False,
+                          random_state=None):
+    """Out-of-core counterpart of cross_validate_binary. x may be a memmap,
+    rows are only loaded one block at a time for fitting and prediction.
+    Returns the same dict as cross_validate_binary"""
+    y = np.asarray(y)
+    cv = list(cv)
+    fold_seeds = derive_seeds(random_state, "fold", len(cv))
+
+    cv_output = {"fit_time": [], "score_time": [], "estimator": []}
+    oof_proba = []
+    for (train_idx, test_idx), fold_seed in zip(cv, fold_seeds):
+        start_time = time.time()
+        fold_model = fit_blocks(estimator, x, y, np.asarray(train_idx),
+                                block_size=block_size, subsample=subsample,
+                                random_state=fold_seed)
+        fit_time = time.time() - start_time
+
+        start_time = time.time()
+        y_proba = predict_proba_blocks(fold_model, x, np.asarray(test_idx),
+                                       block_size=block_size)
+        scores = score_binary(y[test_idx], y_proba,
+                              threshold=threshold)
+        score_time = time.time() - start_time
+
+        cv_output["fit_time"].append(fit_time)
+        cv_output["score_time"].append(score_time)
+        cv_output["estimator"].append(fold_model)
+        if return_oof:
+            fold_oof = np.full(y.shape[0], np.nan)
+            fold_oof[test_idx] = y_proba
+            oof_proba.append(fold_oof)
+        for key, val in scores.items():
+            cv_output.setdefault(f"test_{key}", []).append(val)
+
+    # convert scores to arrays to match sklearn output
+    for key in cv_output:
+        if key != "estimator":
+            cv_output[key] = np.array(cv_output[key])
+
+    if return_oof:
+        cv_output["oof_proba"] = np.column_stack(oof_proba)
+
+    return cv_output
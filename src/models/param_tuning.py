@@ -8,18 +8,28 @@
 #   ======================================================================
 
 import argparse
+import json
+import os
+import pickle
+from pathlib import Path
 
 import hyperopt
 import numpy as np
+import pandas as pd
 from hyperopt import tpe, Trials
+from joblib import Parallel, delayed
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import cross_val_score, StratifiedKFold
 
-from src.data import load_data, load_params, save_params
+from src.data import derive_seeds, fingerprint_data, hash_params, load_data, load_params, minimize_dtypes, \
+    save_params
+from src.data.split_train_dev import create_splits, get_splits
+from src.models.estimators import seed_estimators
+from src.models.metrics import cross_validate_binary, score_binary
+from src.models.oof import create_oof_df, load_oof, oof_key, save_oof, score_oof
 
 
 def main(train_path, cv_idx_path,
-         num_eval=100):
+         num_eval=100, results_dir="./results"):
     """"Search for optimal parameters using hyperopt and write
     to params.yml in root dir"""
 
@@ -33,20 +43,42 @@ def main(train_path, cv_idx_path,
     classifier = params["classifier"]
     target_class = params["train_test_split"]["target_class"]
 
+    # hash the dtypes read from file so cache keys match train_model
+    data_hash = fingerprint_data(train_df)
+    if params["memory"]["minimize_dtypes"]:
+        train_df = minimize_dtypes(train_df, float_dtype=params["memory"]["float_dtype"])
+
     # get independent variables (features) and
     # dependent variables (labels)
     train_feats = train_df.drop(target_class, axis=1)
     train_labels = train_df[target_class]
 
-    # find optimal parameters for a specific model
-    if classifier.lower() == "random_forest":
-        best_params = rf_model(train_feats.to_numpy(),
-                               train_labels.to_numpy(),
-                               random_state=params["random_seed"],
-                               num_eval=num_eval)  # cv=split_generator
-    else:
+    if classifier.lower() != "random_forest":
         raise NotImplementedError
 
+    # optionally estimate generalization of the tuning procedure itself
+    # with nested cross validation on the pre-allocated inner splits
+    if params["param_tuning"]["nested_cv"]:
+        nested_output = nested_cv(train_feats.to_numpy(),
+                                  train_labels.to_numpy(),
+                                  cv_idx,
+                                  random_state=params["random_seed"],
+                                  num_eval=num_eval,
+                                  train_index=train_df.index,
+                                  data_hash=data_hash,
+                                  n_jobs=params["param_tuning"]["n_jobs"])
+        with open(Path(results_dir).joinpath("nested_cv.json"), "w") as writer:
+            writer.writelines(json.dumps(nested_output, indent=4, default=str))
+
+    # find optimal parameters using the same splits as train_model
+    best_params = rf_model(train_feats.to_numpy(),
+                           train_labels.to_numpy(),
+                           cv_splits=list(get_splits(cv_idx).values()),
+                           random_state=params["random_seed"],
+                           num_eval=num_eval,
+                           train_index=train_df.index,
+                           data_hash=data_hash)
+
     # update params
     params["model_params"][classifier] = best_params
 
@@ -54,42 +86,145 @@ def main(train_path, cv_idx_path,
     save_params(params)
 
 
+def normalize_params(trial_params):
+    """Canonical form of a hyperopt parameter dict: quantized floats are cast
+    to int and keys are sorted, so equivalent configurations hash equally"""
+    return {key: int(val) if isinstance(val, float) and val.is_integer() else val
+            for key, val in sorted(trial_params.items())}
+
+
+def _tune_outer_fold(fold_name, x_train, y_train, cv_idx,
+                     random_state=42, num_eval=100,
+                     train_index=None, data_hash=None):
+    """Tune on the inner splits of one outer fold and score the
+    refit model on the outer dev set"""
+    train_idx, test_idx = get_splits(cv_idx)[fold_name]
+    inner_splits = list(get_splits(cv_idx, outer_fold=fold_name).values())
+
+    best_params = rf_model(x_train[train_idx], y_train[train_idx],
+                           cv_splits=inner_splits,
+                           random_state=random_state,
+                           num_eval=num_eval,
+                           train_index=train_index[train_idx],
+                           data_hash=hash_params([data_hash, fold_name]))
+
+    model = RandomForestClassifier(**best_params, random_state=random_state)
+    model.fit(x_train[train_idx], y_train[train_idx])
+    scores = score_binary(y_train[test_idx],
+                          model.predict_proba(x_train[test_idx])[:, 1])
+
+    return {"fold": fold_name, "best_params": best_params, **scores}
+
+
+def nested_cv(x_train, y_train, cv_idx,
+              random_state=42, num_eval=100,
+              train_index=None, data_hash=None,
+              n_jobs=None):
+    """Nested cross validation: hyperparameters are tuned on the inner splits
+    of each outer fold (outer folds in parallel) and the tuned models are
+    scored on the outer dev sets, giving an unbiased estimate of performance"""
+    train_index = np.arange(len(y_train)) if train_index is None else np.asarray(train_index)
+    outer_folds = list(get_splits(cv_idx))
+    assert (len(get_splits(cv_idx, outer_fold=outer_folds[0])) > 0), \
+        ValueError("split_train_dev.csv has no inner splits - set train_test_split.n_inner_split")
+
+    # one seed per outer fold, independent of the order folds run in
+    fold_output = Parallel(n_jobs=n_jobs)(
+        delayed(_tune_outer_fold)(fold_name, x_train, y_train, cv_idx,
+                                  random_state=fold_seed, num_eval=num_eval,
+                                  train_index=train_index, data_hash=data_hash)
+        for fold_name, fold_seed in zip(outer_folds,
+                                        derive_seeds(random_state, "fold", len(outer_folds))))
+
+    fold_scores = pd.DataFrame(fold_output).set_index("fold")
+    return {"metrics": dict(fold_scores.drop(columns="best_params").mean()),
+            "folds": fold_scores.to_dict(orient="index")}
+
+
 def rf_model(x_train, y_train,
+             cv_splits=None,
              random_state=42,
-             num_eval=100):
-    """Train a Random Forest model and determine optimal parameters using hyperopt"""
+             num_eval=100,
+             train_index=None,
+             data_hash=None,
+             oof_dir="./models/oof",
+             trials_dir="./models/tuning"):
+    """Train a Random Forest model and determine optimal parameters using hyperopt.
+    Out-of-fold predictions are read from (and written to) the OOF cache so
+    configurations already evaluated by train_model or earlier trials are not
+    retrained. Trials and scores are memoized by the normalized parameters and
+    data fingerprint and persisted, so repeated sessions resume the search"""
 
-    # load params to create SKF splits using identical params
-    # TODO - fix function to accept iter for CV - keep getting index out of range
+    # load params
     params = load_params()
     params_split = params['train_test_split']
-    params_split["random_seed"] = params["random_seed"]
     num_eval = params["param_tuning"]["num_eval"]
+    target_class = params_split["target_class"]
+    train_index = np.arange(len(y_train)) if train_index is None else train_index
 
     # K-fold split into train and dev sets stratified by train_labels
-    # using random seed for reproducibility
-    skf = StratifiedKFold(n_splits=params_split['n_split'],
-                          random_state=params_split['random_seed'],
-                          shuffle=params_split['shuffle'])
-
-    # objective function
-    def obj_fnc(params):
-        params["n_estimators"] = int(params["n_estimators"])
-        params["min_samples_leaf"] = int(params["min_samples_leaf"])
-        params["min_samples_split"] = int(params["min_samples_split"])
-        estimator = RandomForestClassifier(**params,
-                                           random_state=random_state)
-        score = cross_val_score(estimator, x_train, y=y_train,
-                                scoring='accuracy',
-                                cv=skf.split(x_train, y_train)).mean()
+    # using identical params to split_train_dev if no splits are given
+    if cv_splits is None:
+        cv_splits = create_splits(y_train, n_split=params_split['n_split'],
+                                  n_repeats=params_split['n_repeats'],
+                                  shuffle=params_split['shuffle'],
+                                  random_seed=derive_seeds(params['random_seed'], "split", 1)[0])
+    fold_names = [f"fold_{n_fold + 1:02d}" for n_fold in range(len(cv_splits))]
 
-        return {"loss": -score, "status": hyperopt.STATUS_OK}
+    # fold estimators are seeded as in train_model so cached out-of-fold
+    # predictions are interchangeable
+    fold_seeds = derive_seeds(random_state, "fold", len(cv_splits))
 
     # search space
     criterion_list = ["gini", "entropy"]
     max_depth_list = [None, 4, 6, 8, 10, 12, 15, 20]
     max_features_list = ["auto", "sqrt", "log2"]
 
+    # load trials and scores from previous sessions on the same data and space
+    trials_filepath = Path(trials_dir).resolve().joinpath(
+        "trials_" + hash_params({"data": data_hash, "n_rows": len(y_train),
+                                 "splits": params_split,
+                                 "random_seed": params["random_seed"],
+                                 "space": [criterion_list, max_depth_list,
+                                           max_features_list]}) + ".pkl")
+    if params["param_tuning"]["resume"] and os.path.isfile(trials_filepath):
+        with open(trials_filepath, "rb") as file:
+            memo = pickle.load(file)
+    else:
+        memo = {"trials": Trials(), "scores": {}}
+
+    # objective function
+    def obj_fnc(trial_params):
+        trial_params = normalize_params(trial_params)
+
+        # return previously evaluated configurations instantly
+        # trials fit in memory on the processed features, whatever the
+        # training settings of train_model
+        key = oof_key("random_forest", trial_params, params,
+                      data_hash=data_hash, training_settings=False)
+        if key in memo["scores"]:
+            return {"loss": -memo["scores"][key], "status": hyperopt.STATUS_OK}
+
+        # reuse cached out-of-fold predictions when available
+        oof_df = load_oof(key, oof_dir=oof_dir)
+        if oof_df is None:
+            estimator = RandomForestClassifier(**trial_params)
+            cv_output = cross_validate_binary(estimator, x_train, y_train,
+                                              cv=cv_splits,
+                                              return_oof=True,
+                                              init_estimators=seed_estimators(estimator,
+                                                                              fold_seeds),
+                                              n_jobs=params["training"]["n_jobs"])
+            oof_df = create_oof_df(cv_output["oof_proba"], train_index, y_train,
+                                   fold_names=fold_names,
+                                   target_class=target_class)
+            save_oof(oof_df, key, oof_dir=oof_dir)
+
+        score = score_oof(oof_df, target_class=target_class)["accuracy"].mean()
+        memo["scores"][key] = float(score)
+
+        return {"loss": -score, "status": hyperopt.STATUS_OK}
+
     space = {"n_estimators": hyperopt.hp.quniform("n_estimators", 10, 500, 10),
              "max_features": hyperopt.hp.choice("max_features", max_features_list,),
              "max_depth": hyperopt.hp.choice("max_depth", max_depth_list),
@@ -98,18 +233,23 @@ def rf_model(x_train, y_train,
              "criterion": hyperopt.hp.choice("criterion", criterion_list)
              }
 
-    # create trials instance
-    trials = Trials()
-
-    # compute optimal parameters
-    # TODO - see if can set random_seed to Trials or fmin
+    # compute optimal parameters, continuing from previous trials. The search
+    # seed is derived from the number of completed trials, so a resumed session
+    # explores new points and a rerun from the same state is identical
+    trials = memo["trials"]
+    trial_seed = derive_seeds(random_state, "trial", len(trials.trials) + 1)[-1]
     best_param = hyperopt.fmin(obj_fnc, space,
                                algo=tpe.suggest,
-                               max_evals=num_eval,
+                               max_evals=len(trials.trials) + num_eval,
                                trials=trials,
-                               rstate=np.random.RandomState(random_state)
+                               rstate=np.random.RandomState(trial_seed)
                                )
 
+    # save trials and scores for the next session
+    trials_filepath.parent.mkdir(parents=True, exist_ok=True)
+    with open(trials_filepath, "wb") as file:
+        pickle.dump(memo, file)
+
     # update criterion with text option
     best_param["criterion"] = criterion_list[best_param["criterion"]]
     best_param["max_features"] = max_features_list[best_param["max_features"]]
@@ -130,8 +270,11 @@ if __name__ == '__main__':
     parser.add_argument("-n", "--num-eval", dest="num_eval",
                         default=100,
                         required=False, help="Number of iterations for hyperopt")
+    parser.add_argument("-rd", "--results-dir", dest="results_dir",
+                        default=Path("./results").resolve(),
+                        required=False, help="Output directory for nested CV metrics")
     args = parser.parse_args()
 
     # train model
     main(args.train_path, args.cv_index,
-         args.num_eval)
+         args.num_eval, args.results_dir)
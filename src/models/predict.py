@@ -8,41 +8,108 @@
 #   ======================================================================
 
 import argparse
+import json
 import os
 import pickle
 from pathlib import Path
 
 import pandas as pd
 
-from src.data import load_data, load_params, save_as_csv
+from src.data import load_data, load_params, minimize_dtypes, profile_stage, profile_step, record_shape, save_as_csv
+from src.data.drift import compare_sketches, sketch_batch
+from src.data.validate import validate_features
+from src.features.pipeline import is_fold_pipeline
+from src.models.calibrate import apply_calibration
 from src.models.metrics import james_stein
+from src.models.submission import write_submission
 
 
+def predict_proba(cv_estimators, x_test, index, target_class,
+                  js_estimator=False, calibration=None):
+    """Combine the probabilities of the fold estimators (mean or James-Stein
+    estimate) on a feature matrix and apply the optional calibration. The
+    calibration and decision threshold are fit on mean out-of-fold
+    probabilities (see calibrate.py), so a calibration that changes the
+    probabilities or the threshold is applied to the mean
+
+    Returns:
+        tuple: (DataFrame with the target_class probability, decision threshold)
+    """
+    output = [model.predict_proba(x_test)[:, 1] for model in cv_estimators]
+
+    # create df
+    output_df = pd.DataFrame(output).transpose().set_index(index)
+
+    calibrated = calibration is not None and \
+        (calibration["calibrator"] is not None or calibration["threshold"] != 0.5)
+    if js_estimator and not calibrated:
+        # compute James-Stein estimate for the mean of N-fold cross-validation
+        p_hat_js = james_stein(output_df, limit_shrinkage=True)
+        output_proba = p_hat_js.rename(columns={0: target_class})
+    else:
+        output_proba = pd.DataFrame(output_df.mean(axis=1)).rename(columns={0: target_class})
+
+    # calibrate
+    threshold = 0.5
+    if calibration is not None:
+        output_proba[target_class] = apply_calibration(calibration,
+                                                       output_proba[target_class])
+        threshold = calibration["threshold"]
+
+    return output_proba, threshold
+
+
+@profile_stage("predict_output")
 def main(test_path, results_dir, model_dir,
-         model_name="estimator.pkl"):
-    """Predict survival on held-out test dataset"""
+         model_name="estimator.pkl",
+         compact_name="estimator_compact.pkl",
+         calibration_name="calibration.pkl",
+         sketch_name="reference_sketch.pkl",
+         submission_name="submission.csv",
+         raw_path=None):
+    """Predict survival on held-out test dataset. Fold pipelines (see
+    training.fold_transforms) predict on raw_path, the encode_labels output,
+    which is also compared to the reference sketch of the training data"""
 
     assert (os.path.isdir(results_dir)), NotADirectoryError
     assert (os.path.isdir(model_dir)), NotADirectoryError
     results_dir = Path(results_dir).resolve()
     model_dir = Path(model_dir).resolve()
 
-    # load estimator
-    model_filepath = model_dir.joinpath(model_name)
-    assert (os.path.isfile(model_filepath)), FileNotFoundError
-    with open(model_filepath, 'rb') as model_file:
-        cv_estimators = pickle.load(model_file)
-
-    # read test df
-    test_df = load_data(test_path,
-                        sep=",", header=0,
-                        index_col="PassengerId")
-
     # load params
     params = load_params()
     target_class = params["train_test_split"]["target_class"]
     js_estimator = params["predict"]["js_estimator"]
 
+    # load estimator (optionally the compacted forests, see compact.py)
+    model_filepath = model_dir.joinpath(compact_name if params["predict"]["compact"]
+                                        else model_name)
+    assert (os.path.isfile(model_filepath)), FileNotFoundError
+    with profile_step("load_model"):
+        with open(model_filepath, 'rb') as model_file:
+            cv_estimators = pickle.load(model_file)
+
+        # probability calibration and decision threshold (optional)
+        calibration_filepath = model_dir.joinpath(calibration_name)
+        calibration = None
+        if os.path.isfile(calibration_filepath):
+            with open(calibration_filepath, 'rb') as calibration_file:
+                calibration = pickle.load(calibration_file)
+
+    # read test df
+    with profile_step("load") as prof:
+        test_df = load_data(test_path,
+                            sep=",", header=0,
+                            index_col="PassengerId")
+        record_shape(prof, test_df)
+
+    # same dtypes as the training features
+    if params["memory"]["minimize_dtypes"]:
+        with profile_step("minimize_dtypes") as prof:
+            test_df = minimize_dtypes(test_df,
+                                      float_dtype=params["memory"]["float_dtype"],
+                                      record=prof)
+
     # get independent variables (features) and
     # dependent variables (labels)
     if target_class in test_df.columns:
@@ -50,31 +117,66 @@ def main(test_path, results_dir, model_dir,
     else:
         test_feats = test_df
 
-    # predict output
-    output = [model.predict_proba(test_feats)[:, 1] for model in cv_estimators]
+    # features must match those the fold estimators were trained on
+    with profile_step("validate"):
+        validate_features(test_feats,
+                          n_features=getattr(cv_estimators[0], "n_features_in_", None))
+
+    # raw features of the same rows (encode_labels output)
+    raw_feats = None
+    if raw_path is not None:
+        with profile_step("load_raw") as prof:
+            raw_df = load_data(raw_path, sep=",", header=0,
+                               index_col="PassengerId")
+            raw_feats = raw_df.loc[test_feats.index].drop(columns=target_class, errors="ignore")
+            record_shape(prof, raw_feats)
+
+    # compare the raw scoring batch to the raw training distribution
+    sketch_filepath = model_dir.joinpath(sketch_name)
+    if raw_feats is not None and os.path.isfile(sketch_filepath):
+        with profile_step("drift", data=raw_feats):
+            with open(sketch_filepath, "rb") as file:
+                reference_sketch = pickle.load(file)
+
+            batch_sketch = sketch_batch(reference_sketch, raw_feats)
+            drift_summary, drift_df = compare_sketches(
+                reference_sketch, batch_sketch,
+                psi_threshold=params["monitoring"]["psi_threshold"])
+            drift_summary["columns"] = drift_df.to_dict(orient="index")
+            with open(results_dir.joinpath("drift.json"), "w") as writer:
+                writer.writelines(json.dumps(drift_summary, indent=4))
+
+    # fold pipelines transform the raw features with the stats of their fold
+    x_test = test_feats.to_numpy()
+    if is_fold_pipeline(cv_estimators[0]):
+        assert (raw_feats is not None), ValueError("Fold pipelines require raw_path")
+        x_test = raw_feats.to_numpy(dtype=float)
 
-    # create df
-    output_df = pd.DataFrame(output).transpose().set_index(test_feats.index)
-
-    if js_estimator:
-        # compute James-Stein estimate for the mean of N-fold cross-validation
-        p_hat_js = james_stein(output_df, limit_shrinkage=True)
-        output_proba = p_hat_js.rename(columns={0: target_class})
-    else:
-        output_proba = pd.DataFrame(output_df.mean(axis=1)).rename(columns={0: target_class})
+    # predict output
+    with profile_step("predict", data=test_feats):
+        output_proba, threshold = predict_proba(cv_estimators, x_test,
+                                                test_feats.index, target_class,
+                                                js_estimator=js_estimator,
+                                                calibration=calibration)
 
     # binarize
-    output_binary = (output_proba > 0.5).astype(int)
+    output_binary = (output_proba > threshold).astype(int)
 
     # save output
-    save_as_csv(output_proba, test_path, results_dir,
-                replace_text="_processed.csv",
-                suffix="_predict_proba.csv",
-                na_rep="nan")
-    save_as_csv(output_binary, test_path, results_dir,
-                replace_text="_processed.csv",
-                suffix="_predict_binary.csv",
-                na_rep="nan")
+    with profile_step("save", data=output_proba):
+        save_as_csv(output_proba, test_path, results_dir,
+                    replace_text="_processed.csv",
+                    suffix="_predict_proba.csv",
+                    na_rep="nan")
+        save_as_csv(output_binary, test_path, results_dir,
+                    replace_text="_processed.csv",
+                    suffix="_predict_binary.csv",
+                    na_rep="nan")
+
+        # Kaggle submission (PassengerId,Survived), gzip for a .gz name
+        write_submission(output_binary.index, output_binary[target_class],
+                         results_dir.joinpath(submission_name),
+                         columns=(output_binary.index.name, target_class))
 
 
 if __name__ == '__main__':
@@ -87,7 +189,17 @@ if __name__ == '__main__':
     parser.add_argument("-md", "--model-dir", dest="model_dir",
                         default=Path("./models").resolve(),
                         required=False, help="Model output directory")
+    parser.add_argument("-sn", "--submission-name", dest="submission_name",
+                        default="submission.csv", required=False,
+                        help="Submission file name in the results directory "
+                             "(gzip compressed for a .gz suffix)")
+    parser.add_argument("-raw", "--raw-test", dest="raw_path",
+                        default=None, required=False,
+                        help="Test CSV file before imputation and feature engineering "
+                             "(used by fold pipelines and drift monitoring)")
     args = parser.parse_args()
 
     # train model
-    main(args.test_path, args.results_dir, args.model_dir)
+    main(args.test_path, args.results_dir, args.model_dir,
+         submission_name=args.submission_name,
+         raw_path=args.raw_path)
@@ -0,0 +1,175 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import argparse
+import json
+import os
+import pickle
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.data import load_data, load_params, minimize_dtypes
+from src.data.validate import validate_features
+from src.features.pipeline import is_fold_pipeline
+from src.models.predict import predict_proba
+
+
+def load_models(model_dirs, names=None,
+                model_name="estimator.pkl",
+                calibration_name="calibration.pkl"):
+    """Load the fold estimators and optional calibration of each model
+    directory once. The first model is the champion
+
+    Returns:
+        dict: name -> {"estimators": list, "calibration": dict or None}
+    """
+    names = [Path(elem).resolve().name for elem in model_dirs] if names is None else names
+    assert (len(names) == len(model_dirs)), ValueError
+    assert (len(set(names)) == len(names)), ValueError("Model names must be unique")
+
+    models = {}
+    for name, model_dir in zip(names, model_dirs):
+        model_dir = Path(model_dir).resolve()
+        with open(model_dir.joinpath(model_name), "rb") as file:
+            models[name] = {"estimators": pickle.load(file), "calibration": None}
+
+        calibration_filepath = model_dir.joinpath(calibration_name)
+        if os.path.isfile(calibration_filepath):
+            with open(calibration_filepath, "rb") as file:
+                models[name]["calibration"] = pickle.load(file)
+
+    return models
+
+
+def score_models(models, test_feats, target_class, js_estimator=False,
+                 raw_feats=None):
+    """Score one feature batch with every model. The feature matrix is
+    validated and converted once and shared by all models. Fold pipelines
+    (training.fold_transforms) score raw_feats, the encode_labels features
+    of the same rows
+
+    Returns:
+        tuple: (DataFrame with <name>_proba and <name>_binary columns side by
+            side, dict of per-model latency)
+    """
+    validate_features(test_feats)
+    x_processed = test_feats.to_numpy()
+    x_raw = None if raw_feats is None else raw_feats.to_numpy(dtype=float)
+
+    outputs = []
+    latency = {}
+    for name, model in models.items():
+        x_test = x_processed
+        if is_fold_pipeline(model["estimators"][0]):
+            assert (x_raw is not None), ValueError(f"{name}: fold pipelines require raw_feats")
+            x_test = x_raw
+
+        n_features = getattr(model["estimators"][0], "n_features_in_", x_test.shape[1])
+        if n_features != x_test.shape[1]:
+            raise ValueError(f"{name}: expected {n_features} features, got {x_test.shape[1]}")
+
+        start_time = time.perf_counter()
+        output_proba, threshold = predict_proba(model["estimators"], x_test,
+                                                test_feats.index, target_class,
+                                                js_estimator=js_estimator,
+                                                calibration=model["calibration"])
+        wall_time = time.perf_counter() - start_time
+
+        outputs.append(output_proba[target_class].rename(f"{name}_proba"))
+        outputs.append((output_proba[target_class] > threshold).astype(int)
+                       .rename(f"{name}_binary"))
+        latency[name] = {"wall_time": round(wall_time, 4),
+                         "us_per_row": round(1e6 * wall_time / max(x_test.shape[0], 1), 2),
+                         "n_estimators": len(model["estimators"]),
+                         "threshold": float(threshold)}
+
+    return pd.concat(outputs, axis=1), latency
+
+
+def compare_to_champion(output_df, names):
+    """Agreement of each candidate's binary predictions with the champion
+    (first model) and the mean absolute difference of the probabilities"""
+    champion = names[0]
+    comparison = {}
+    for name in names[1:]:
+        comparison[name] = {
+            "agreement": float(np.mean(output_df[f"{name}_binary"] ==
+                                       output_df[f"{champion}_binary"])),
+            "mean_abs_diff": float(np.mean(np.abs(output_df[f"{name}_proba"] -
+                                                  output_df[f"{champion}_proba"])))}
+
+    return comparison
+
+
+def main(test_path, model_dirs, results_dir,
+         names=None, raw_path=None):
+    """Score the test set with several model artifacts (champion first)
+    and save side-by-side predictions and per-model latency. Fold pipelines
+    score the raw_path rows (the encode_labels output)"""
+    assert (os.path.isdir(results_dir)), NotADirectoryError
+    results_dir = Path(results_dir).resolve()
+
+    # load params
+    params = load_params()
+    target_class = params["train_test_split"]["target_class"]
+
+    models = load_models(model_dirs, names=names)
+
+    # read test df
+    test_df = load_data(test_path, sep=",", header=0,
+                        index_col="PassengerId")
+    test_feats = test_df.drop(columns=[target_class], errors="ignore")
+    if params["memory"]["minimize_dtypes"]:
+        test_feats = minimize_dtypes(test_feats, float_dtype=params["memory"]["float_dtype"])
+
+    raw_feats = None
+    if raw_path is not None:
+        raw_df = load_data(raw_path, sep=",", header=0,
+                           index_col="PassengerId")
+        raw_feats = raw_df.loc[test_feats.index].drop(columns=target_class, errors="ignore")
+
+    output_df, latency = score_models(models, test_feats, target_class,
+                                      js_estimator=params["predict"]["js_estimator"],
+                                      raw_feats=raw_feats)
+
+    # save side-by-side output and latency report
+    output_df.to_csv(results_dir.joinpath("model_comparison.csv"))
+    report = {"latency": latency,
+              "champion": list(models)[0],
+              "comparison": compare_to_champion(output_df, list(models))}
+    with open(results_dir.joinpath("model_comparison.json"), "w") as writer:
+        writer.writelines(json.dumps(report, indent=4))
+
+    return output_df, report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-te", "--test", dest="test_path",
+                        required=True, help="CSV file")
+    parser.add_argument("-md", "--model-dirs", dest="model_dirs", nargs="+",
+                        required=True,
+                        help="Model directories with estimator.pkl (champion first)")
+    parser.add_argument("-n", "--names", dest="names", nargs="+",
+                        default=None, help="Model names (default directory names)")
+    parser.add_argument("-rd", "--results-dir", dest="results_dir",
+                        default=Path("./results").resolve(),
+                        required=False, help="Output directory")
+    parser.add_argument("-raw", "--raw-test", dest="raw_path",
+                        default=None, required=False,
+                        help="Test CSV file before imputation and feature engineering "
+                             "(required for fold pipelines)")
+    args = parser.parse_args()
+
+    # score models side by side
+    main(args.test_path, args.model_dirs, args.results_dir,
+         names=args.names, raw_path=args.raw_path)
@@ -0,0 +1,88 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import gzip
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+def format_submission(index, labels, chunksize=1000000):
+    """Yield the rows of a submission as bytes, one chunk of rows at a time.
+    Each chunk is laid out as a uint8 matrix of right-aligned id digits
+    followed by the label; masking the leading zeros and flattening gives
+    the CSV rows without per-row Python string formatting"""
+    index = np.asarray(index)
+    labels = np.asarray(labels)
+    assert (index.shape == labels.shape), ValueError
+    assert (np.issubdtype(index.dtype, np.integer) and (index >= 0).all()), \
+        ValueError("Ids must be non-negative integers")
+    assert (np.isin(labels, [0, 1]).all()), ValueError("Labels must be binary")
+
+    n_digits = len(str(int(index.max()))) if index.shape[0] > 0 else 1
+    powers = 10 ** np.arange(n_digits - 1, -1, -1, dtype=np.int64)
+    for start in range(0, index.shape[0], chunksize):
+        ids = index[start:start + chunksize].astype(np.int64)[:, None]
+
+        # digits, ",", label and "\n" of each row
+        rows = np.empty((ids.shape[0], n_digits + 3), dtype=np.uint8)
+        rows[:, :n_digits] = ids // powers % 10 + ord("0")
+        rows[:, n_digits] = ord(",")
+        rows[:, n_digits + 1] = labels[start:start + chunksize] + ord("0")
+        rows[:, n_digits + 2] = ord("\n")
+
+        # drop leading zeros (the id 0 keeps one digit)
+        keep = np.ones(rows.shape, dtype=bool)
+        keep[:, :n_digits] = powers <= np.maximum(ids, 1)
+        yield rows[keep].tobytes()
+
+
+def write_submission(index, labels, filepath,
+                     columns=("PassengerId", "Survived"),
+                     compression="infer",
+                     compresslevel=6,
+                     chunksize=1000000,
+                     buffer_size=2 ** 20):
+    """Write a Kaggle submission (id,label) directly from NumPy arrays with
+    buffered writes. The file is written to a temporary file and renamed,
+    and is identical to DataFrame.to_csv of the same data
+
+    Args:
+        index (array-like): integer ids (e.g. PassengerId)
+        labels (array-like): binary predictions
+        filepath (str): output CSV file
+        columns (tuple): header names of the id and label columns
+        compression (str): "gzip", None or "infer" (gzip for a .gz suffix)
+        compresslevel (int): gzip compression level
+        chunksize (int): rows formatted at a time
+        buffer_size (int): size of the write buffer in bytes
+
+    Returns:
+        Path: filepath
+    """
+    filepath = Path(filepath)
+    if compression == "infer":
+        compression = "gzip" if filepath.suffix == ".gz" else None
+    if compression not in ("gzip", None):
+        raise NotImplementedError(compression)
+
+    tmp_filepath = filepath.with_name(f".tmp_{filepath.name}")
+    with open(tmp_filepath, "wb", buffering=buffer_size) as file:
+        writer = gzip.GzipFile(fileobj=file, mode="wb", mtime=0,
+                               compresslevel=compresslevel) \
+            if compression == "gzip" else file
+        writer.write(f"{columns[0]},{columns[1]}\n".encode("utf-8"))
+        for chunk in format_submission(index, labels, chunksize=chunksize):
+            writer.write(chunk)
+        if compression == "gzip":
+            writer.close()
+    os.replace(tmp_filepath, filepath)
+
+    return filepath
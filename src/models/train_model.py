@@ -11,71 +11,191 @@ import argparse
 import json
 import os
 import pickle
+import tempfile
 from pathlib import Path
 
-import numpy as np
 import pandas as pd
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import make_scorer
-from sklearn.model_selection import cross_validate
-from xgboost import XGBClassifier
+from sklearn.base import clone
 
-from src.data import load_data, load_params
-from src.models.metrics import gmpr_score
+from src.data import derive_seeds, fingerprint_data, load_data, load_params, minimize_dtypes, profile_stage, profile_step, \
+    record_shape
+from src.data.drift import sketch_csv
+from src.data.split_train_dev import get_splits
+from src.data.validate import validate_features
+from src.features.pipeline import fold_pipeline, fold_transformer
+from src.models.estimators import categorical_mask, get_estimator, seed_estimators
+from src.models.metrics import cross_validate_binary
+from src.models.oof import create_oof_df, oof_key, save_oof
+from src.models.out_of_core import cross_validate_blocks, csv_to_memmap
 
 
+@profile_stage("train_model")
 def main(train_path, cv_idx_path,
-         results_dir, model_dir):
-    """Train RandomForest model and predict survival on
-    Kaggle test set"""
+         results_dir, model_dir,
+         raw_path=None):
+    """Train the classifier selected in params.yaml using the
+    pre-allocated cross validation splits. With training.fold_transforms,
+    imputation and feature engineering are fit on the training rows of each
+    fold from raw_path (the encode_labels output) instead of using the
+    processed features. The reference sketch for drift monitoring is also
+    computed from raw_path"""
     assert (os.path.isdir(results_dir)), NotADirectoryError
     assert (os.path.isdir(model_dir)), NotADirectoryError
     results_dir = Path(results_dir).resolve()
     model_dir = Path(model_dir).resolve()
 
-    # read files
-    train_df, cv_idx = load_data([train_path, cv_idx_path],
-                                 sep=",", header=0,
-                                 index_col="PassengerId")
     # load params
     params = load_params()
     classifier = params["classifier"]
     target_class = params["train_test_split"]["target_class"]
     model_params = params["model_params"][classifier]
+    params_training = params["training"]
+
+    # read files. Out-of-core, the features are copied block by block into
+    # a temporary memmap and only the labels are held in memory
+    memmap_dir = None
+    with profile_step("load") as prof:
+        cv_idx = load_data(cv_idx_path, sep=",", header=0,
+                           index_col="PassengerId")
+        if params_training["out_of_core"]:
+            memmap_dir = tempfile.TemporaryDirectory()
+            x_train, train_labels, feature_cols, data_hash = \
+                csv_to_memmap(train_path, os.path.join(memmap_dir.name, "train.npy"),
+                              target_class, chunksize=params_training["block_size"])
+        else:
+            train_df = load_data(train_path, sep=",", header=0,
+                                 index_col="PassengerId")
+            record_shape(prof, train_df)
+
+            # fail before training on NaN, non-numeric features or non-binary labels
+            validate_features(train_df, target_class=target_class)
+            data_hash = fingerprint_data(train_df)
+
+            # (u)int8/float32 training matrix. The data hash above uses the
+            # dtypes read from file, as in calibrate
+            if params["memory"]["minimize_dtypes"]:
+                train_df = minimize_dtypes(train_df,
+                                           float_dtype=params["memory"]["float_dtype"],
+                                           record=prof)
+
+            # get independent variables (features) and
+            # dependent variables (labels)
+            feature_cols = train_df.columns.drop(target_class)
+            x_train = train_df[feature_cols].to_numpy()
+            train_labels = train_df[target_class]
 
-    # get independent variables (features) and
-    # dependent variables (labels)
-    train_feats = train_df.drop(target_class, axis=1)
-    train_labels = train_df[target_class]
+    if cv_idx.shape[0] != train_labels.shape[0]:
+        raise ValueError("Split file does not match the number of training rows")
+
+    # the processed features were fit on all training rows, which leaks
+    # the dev set of each fold into its imputation values and bins
+    if params_training["fold_transforms"]:
+        if params_training["out_of_core"]:
+            raise NotImplementedError("fold_transforms is not supported out of core")
+        assert (raw_path is not None), ValueError("fold_transforms requires raw_path")
+        with profile_step("load_raw") as prof:
+            raw_df = load_data(raw_path, sep=",", header=0,
+                               index_col="PassengerId")
+            raw_feats = raw_df.loc[train_labels.index].drop(columns=target_class)
+            record_shape(prof, raw_feats)
+
+    # reference sketch of the raw training features for drift monitoring,
+    # before imputation fills NaN and feature engineering bins the values
+    reference_sketch = None
+    if raw_path is not None:
+        with profile_step("sketch"):
+            params_monitoring = params["monitoring"]
+            reference_sketch = sketch_csv(raw_path, drop_columns=[target_class],
+                                          bins=params_monitoring["bins"],
+                                          max_categories=params_monitoring["max_categories"],
+                                          block_size=params_training["block_size"],
+                                          sample_size=params_monitoring["sample_size"],
+                                          random_state=params["random_seed"])
+
+    # categorical columns of the features seen by the estimator. Fold
+    # pipelines transform the raw columns, the names of the output columns
+    # do not depend on the rows the transformer is fit on
+    estimator_cols = fold_transformer(raw_feats.columns, params).fit(raw_feats) \
+        .get_feature_names_out() if params_training["fold_transforms"] else feature_cols
 
     # create instance using random seed for reproducibility
-    if classifier.lower() == "random_forest":
-        model = RandomForestClassifier(**model_params,
-                                       random_state=params["random_seed"])
-    elif classifier.lower() == "xgboost":
-        model = XGBClassifier(random_state=params["random_seed"])
-    else:
-        raise NotImplementedError
-
-    # create generator with cv splits
-    split_generator = iter((np.where(cv_idx[col] == "train")[0],
-                            np.where(cv_idx[col] == "test")[0]) for col in cv_idx)
-
-    # set model scoring metrics
-    # TODO - add custom metric for GMPR
-    scoring = {'accuracy': 'accuracy', 'balanced_accuracy': 'balanced_accuracy',
-               'f1': 'f1',
-               "gmpr": make_scorer(gmpr_score, greater_is_better=True),
-               'jaccard': 'jaccard', 'precision': 'precision',
-               'recall': 'recall', 'roc_auc': 'roc_auc'}
-
-    # train using cross validation
-    cv_output = cross_validate(model, train_feats.to_numpy(),
-                               train_labels.to_numpy(),
-                               cv=split_generator,
-                               fit_params=None,
-                               scoring=scoring,
-                               return_estimator=True)
+    model = get_estimator(classifier, model_params,
+                          random_state=params["random_seed"],
+                          categorical_features=categorical_mask(estimator_cols,
+                                                                params["dtypes"],
+                                                                target_class=target_class))
+    if params_training["fold_transforms"]:
+        model = fold_pipeline(model, raw_feats.columns, params,
+                              memory=model_dir.joinpath("transform_cache"))
+
+    # create list with (outer) cv splits
+    fold_splits = get_splits(cv_idx)
+    cv_splits = list(fold_splits.values())
+    fold_fingerprints = [None if params_training["out_of_core"] else
+                         fingerprint_data(train_df.iloc[train_idx])
+                         for train_idx, _ in cv_splits]
+
+    # one seed per fold derived from random_seed, so fold estimators are
+    # identical whether folds run serially or in parallel
+    fold_estimators = seed_estimators(model, derive_seeds(params["random_seed"], "fold",
+                                                          len(cv_splits)))
+
+    # optionally reuse fold estimators from the previous run (warm start)
+    init_estimators = fold_estimators
+    estimator_filepath = model_dir.joinpath("estimator.pkl")
+    if params_training["incremental"] and not params_training["out_of_core"] and \
+            os.path.isfile(estimator_filepath):
+        with open(estimator_filepath, "rb") as file:
+            prev_estimators = pickle.load(file)
+
+        if len(prev_estimators) == len(cv_splits):
+            init_estimators = [warm_start_estimator(prev_model, fold_model, fingerprint)
+                               for prev_model, fold_model, fingerprint in
+                               zip(prev_estimators, fold_estimators, fold_fingerprints)]
+
+    # train using cross validation; each fold estimator predicts once
+    # and accuracy, balanced_accuracy, f1, gmpr, jaccard, precision,
+    # recall and roc_auc are all derived from the same probabilities
+    with profile_step("cross_validate") as prof:
+        if params_training["out_of_core"]:
+            # forest sub-ensembles fit on stratified blocks and merged per fold
+            cv_output = cross_validate_blocks(model, x_train,
+                                              train_labels.to_numpy(),
+                                              cv=cv_splits,
+                                              block_size=params_training["block_size"],
+                                              subsample=params_training["subsample"],
+                                              return_oof=True,
+                                              random_state=params["random_seed"])
+            memmap_dir.cleanup()
+        else:
+            cv_output = cross_validate_binary(model,
+                                              raw_feats.to_numpy(dtype=float)
+                                              if params_training["fold_transforms"] else x_train,
+                                              train_labels.to_numpy(),
+                                              cv=cv_splits,
+                                              return_oof=True,
+                                              init_estimators=init_estimators,
+                                              n_jobs=params_training["n_jobs"])
+        record_shape(prof, x_train)
+        prof["fit_time"] = round(float(cv_output["fit_time"].sum()), 4)
+        prof["predict_time"] = round(float(cv_output["score_time"].sum()), 4)
+
+    # record the training data of each fold for future warm starts
+    for fold_model, fingerprint in zip(cv_output["estimator"], fold_fingerprints):
+        if "warm_start" in fold_model.get_params():
+            fold_model.set_params(warm_start=False)
+        fold_model.fold_fingerprint_ = fingerprint
+
+    # cache out-of-fold predictions keyed by PassengerId and params hash
+    # so downstream analyses do not need to rerun inference
+    oof_df = create_oof_df(cv_output.pop("oof_proba"),
+                           train_labels.index, train_labels,
+                           fold_names=list(fold_splits),
+                           target_class=target_class)
+    save_oof(oof_df,
+             oof_key(classifier, model_params, params,
+                     data_hash=data_hash),
+             oof_dir=model_dir.joinpath("oof"))
 
     # get cv estimators
     cv_estimators = cv_output.pop('estimator')
@@ -87,8 +207,12 @@ def main(train_path, cv_idx_path,
     cv_metrics = cv_metrics.rename(columns=col_mapper)
 
     # save cv estimators as pickle file
-    with open(model_dir.joinpath("estimator.pkl"), "wb") as file:
-        pickle.dump(cv_estimators, file)
+    with profile_step("save"):
+        with open(model_dir.joinpath("estimator.pkl"), "wb") as file:
+            pickle.dump(cv_estimators, file)
+        if reference_sketch is not None:
+            with open(model_dir.joinpath("reference_sketch.pkl"), "wb") as file:
+                pickle.dump(reference_sketch, file)
 
     # save metrics
     metrics = json.dumps(dict(cv_metrics.mean()))
@@ -96,6 +220,37 @@ def main(train_path, cv_idx_path,
         writer.writelines(metrics)
 
 
+def warm_start_estimator(prev_model, model, fingerprint,
+                         ignore_params=("n_estimators", "warm_start",
+                                        "n_jobs", "verbose")):
+    """Prepare a previously fitted fold estimator for incremental training.
+
+    If the estimator supports warm_start, the fold was trained on the same
+    data and only n_estimators grew, the previous trees are kept and fit()
+    only adds the new trees. If nothing changed, fit() is a no-op. Otherwise
+    an unfitted clone of model is returned for a full retrain."""
+    model_params = model.get_params()
+    if type(prev_model) is not type(model) or "warm_start" not in model_params \
+            or "n_estimators" not in model_params:
+        return clone(model)
+
+    # any change other than the number of trees requires a full retrain
+    prev_params = prev_model.get_params()
+    if any(prev_params.get(key) != val for key, val in model_params.items()
+           if key not in ignore_params):
+        return clone(model)
+
+    # trees cannot be removed, and trees fit on other data (e.g. rows of
+    # the dev set of this fold) must not be kept
+    n_prev = len(getattr(prev_model, "estimators_", []))
+    same_data = getattr(prev_model, "fold_fingerprint_", None) == fingerprint
+    if not same_data or model_params["n_estimators"] < n_prev:
+        return clone(model)
+
+    return prev_model.set_params(n_estimators=model_params["n_estimators"],
+                                 warm_start=True)
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("-tr", "--train", dest="train_path",
@@ -108,8 +263,13 @@ if __name__ == '__main__':
     parser.add_argument("-md", "--model-dir", dest="model_dir",
                         default=Path("./models").resolve(),
                         required=False, help="Model output directory")
+    parser.add_argument("-raw", "--raw-train", dest="raw_path",
+                        default=None, required=False,
+                        help="Train CSV file before imputation and feature engineering "
+                             "(used with training.fold_transforms and for the drift reference)")
     args = parser.parse_args()
 
     # train model
     main(args.train_path, args.cv_index,
-         args.results_dir, args.model_dir)
+         args.results_dir, args.model_dir,
+         raw_path=args.raw_path)
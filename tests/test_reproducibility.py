@@ -0,0 +1,53 @@
+#   -*- coding: utf-8 -*-
+#  Copyright (c) 2021.  Jeffrey J. Nirschl. All rights reserved.
+#
+#   Licensed under the MIT license. See the LICENSE.md file in the project
+#   root directory for full license information.
+#
+#   Time-stamp: <>
+#   ======================================================================
+
+import numpy as np
+import pytest
+
+from src.data import derive_seeds
+from src.data.make_synthetic import create
+from src.data.split_train_dev import create_split_df, get_splits
+from src.models.estimators import get_estimator, seed_estimators
+from src.models.metrics import cross_validate_binary
+
+RANDOM_SEED = 42
+
+
+@pytest.fixture(scope="module")
+def train_data():
+    """Numeric features and labels from a synthetic training set"""
+    df = create(400, random_state=RANDOM_SEED)
+    df["Sex"] = (df["Sex"] == "female").astype(int)
+    df["Embarked"] = df["Embarked"].map({"S": 0, "C": 1, "Q": 2}).fillna(-1)
+    df["Age"] = df["Age"].fillna(df["Age"].median())
+    x = df[["Pclass", "Sex", "Age", "SibSp", "Parch", "Fare", "Embarked"]].to_numpy()
+    return x, df["Survived"].to_numpy()
+
+
+def cross_validate(x, y, n_jobs):
+    """Cross validate seeded random forests on a fixed 5-fold split"""
+    cv_idx = create_split_df(y, n_split=5, random_seed=RANDOM_SEED)
+    cv_splits = list(get_splits(cv_idx).values())
+    model = get_estimator("random_forest", {"n_estimators": 20, "max_depth": 5},
+                          random_state=RANDOM_SEED)
+    return cross_validate_binary(model, x, y, cv=cv_splits, return_oof=True,
+                                 init_estimators=seed_estimators(
+                                     model, derive_seeds(RANDOM_SEED, "fold", len(cv_splits))),
+                                 n_jobs=n_jobs)
+
+
+def test_serial_and_parallel_cross_validation_match(train_data):
+    x, y = train_data
+    serial = cross_validate(x, y, n_jobs=1)
+    parallel = cross_validate(x, y, n_jobs=2)
+
+    keys = [key for key in serial if key.startswith("test_") or key == "oof_proba"]
+    assert "oof_proba" in keys
+    for key in keys:
+        np.testing.assert_array_equal(serial[key], parallel[key], err_msg=key)